@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+from urlextract import URLExtract
+from framecache import per_frame
+import perf
+from preprocessor import MONTHS, DAYS, date_feature
+from columns import user_codes
+from tokens import MEDIA_MESSAGE
+from emojis import emoji_index
+
+# Initialize URL extractor; all candidates go through one call, so no cap on URLs per call
+extract = URLExtract(limit=None)
+
+# URLExtract only finds URLs with a scheme (e.g. http://localhost), around a top-level domain
+# (a dot followed by a letter) or with a dotted IPv4 host
+URL_CANDIDATE_PATTERN = r'://|\.[^\W\d_]|\d\.\d{1,3}\.\d'
+
+
+def link_counts(messages):
+    """Number of URLs in each message"""
+    counts = np.zeros(len(messages), dtype=np.int64)
+
+    # Most messages can't contain a URL; only the rest go through URLExtract
+    candidates = np.flatnonzero(messages.str.contains(URL_CANDIDATE_PATTERN, regex=True).to_numpy())
+    if candidates.size == 0:
+        return counts
+
+    # One URLExtract pass over the candidates joined by newlines, mapped back to messages by offset
+    texts = messages.iloc[candidates].tolist()
+    starts = np.cumsum([0] + [len(text) + 1 for text in texts[:-1]])
+    try:
+        urls = extract.find_urls("\n".join(texts), get_indices=True)
+    except Exception as e:
+        print(f"Error extracting URLs: {e}")
+        return counts
+
+    positions = np.array([start for _, (start, _) in urls], dtype=np.int64)
+    owners = np.searchsorted(starts, positions, side='right') - 1
+    np.add.at(counts, candidates[owners], 1)
+    return counts
+
+
+@per_frame
+def message_features(df):
+    """Words, media, links and emojis of every message, as arrays"""
+    messages = df['message'].astype(str)
+    return {
+        'words': messages.str.count(r'\S+').to_numpy(),
+        'media': (messages == MEDIA_MESSAGE).to_numpy(),
+        'links': link_counts(messages),
+        'emojis': emoji_index(df).per_message(),
+    }
+
+
+def _per_user(codes, n_users, weights=None):
+    return np.bincount(codes, weights=weights, minlength=n_users).astype(np.int64)
+
+
+def _per_user_bucket(codes, buckets, n_users, n_buckets):
+    counts = np.bincount(codes * n_buckets + buckets, minlength=n_users * n_buckets)
+    return counts.reshape(n_users, n_buckets)
+
+
+class ChatCube:
+    """
+    Message counts per user x hour, x weekday and x month plus per-user totals
+    (messages, words, media, links, emojis), computed once per chat.
+    "Overall" figures are sums over all users.
+    """
+
+    def __init__(self, df):
+        codes, users = user_codes(df)
+        self.users = users.astype(str)
+        n_users = len(self.users)
+
+        if len(df):
+            hours = date_feature(df, 'hour').to_numpy().astype(np.int64)
+            weekdays = df['date'].dt.dayofweek.to_numpy().astype(np.int64)
+            months = (date_feature(df, 'year').to_numpy().astype(np.int64) * 12
+                      + date_feature(df, 'month_num').to_numpy() - 1)
+        else:
+            hours = weekdays = months = np.zeros(0, dtype=np.int64)
+
+        # Months are numbered year * 12 + month - 1; only months with messages get a column
+        self.months, month_codes = np.unique(months, return_inverse=True)
+
+        self.by_hour = _per_user_bucket(codes, hours, n_users, 24)
+        self.by_weekday = _per_user_bucket(codes, weekdays, n_users, 7)
+        self.by_month = _per_user_bucket(codes, month_codes.astype(np.int64), n_users, len(self.months))
+
+        features = message_features(df)
+        self.messages = _per_user(codes, n_users)
+        for name in ('words', 'media', 'links', 'emojis'):
+            setattr(self, name, _per_user(codes, n_users, features[name]))
+
+    # Per-user totals and per-user x bucket counts
+    TOTALS = ('messages', 'words', 'media', 'links', 'emojis')
+    BUCKETS = ('by_hour', 'by_weekday')
+
+    def update(self, df, sign=1):
+        """
+        Add the messages of `df` to the cube in place (or remove them with sign=-1),
+        aligning new users and months, so appended messages don't require a rebuild.
+        """
+        other = ChatCube(df)
+        users = self.users.append(other.users.difference(self.users, sort=False))
+        months = np.union1d(self.months, other.months)
+        mine, theirs = users.get_indexer(self.users), users.get_indexer(other.users)
+
+        for name in self.TOTALS + self.BUCKETS:
+            values = getattr(self, name)
+            merged = np.zeros((len(users),) + values.shape[1:], dtype=np.int64)
+            merged[mine] += values
+            merged[theirs] += sign * getattr(other, name)
+            setattr(self, name, merged)
+
+        by_month = np.zeros((len(users), len(months)), dtype=np.int64)
+        by_month[np.ix_(mine, np.searchsorted(months, self.months))] += self.by_month
+        by_month[np.ix_(theirs, np.searchsorted(months, other.months))] += sign * other.by_month
+
+        self.users, self.months, self.by_month = users, months, by_month
+        return self
+
+    def save(self, path):
+        arrays = {name: getattr(self, name) for name in self.TOTALS + self.BUCKETS + ('by_month', 'months')}
+        np.savez(path, users=self.users.to_numpy(dtype=str), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        cube = cls.__new__(cls)
+        with np.load(path) as arrays:
+            for name in arrays.files:
+                setattr(cube, name, arrays[name])
+        cube.users = pd.Index(cube.users, dtype=object)
+        return cube
+
+    def _select(self, values, selected_user):
+        if selected_user == 'Overall':
+            return values.sum(axis=0)
+        if selected_user not in self.users:
+            return np.zeros(values.shape[1:], dtype=values.dtype) if values.ndim > 1 else 0
+        return values[self.users.get_loc(selected_user)]
+
+    def total(self, name, selected_user='Overall'):
+        """A per-user total ('messages', 'words', 'media', 'links', 'emojis') for one user or everyone"""
+        return int(self._select(getattr(self, name), selected_user))
+
+    def counts(self, name, selected_user='Overall'):
+        """A per-user count vector ('by_hour', 'by_weekday', 'by_month') for one user or everyone"""
+        return self._select(getattr(self, name), selected_user)
+
+    def month_frame(self, selected_user='Overall'):
+        """Message count of every month the user was active in, in calendar order"""
+        counts = self.counts('by_month', selected_user)
+        active = counts > 0
+        month_index = self.months[active] % 12
+        return pd.DataFrame({
+            'year': self.months[active] // 12,
+            'month_num': month_index + 1,
+            'month': np.array(MONTHS, dtype=object)[month_index],
+            'message': counts[active],
+        })
+
+    def hour_series(self, selected_user='Overall'):
+        return pd.Series(self.counts('by_hour', selected_user), index=pd.RangeIndex(24, name='hour'))
+
+    def weekday_series(self, selected_user='Overall'):
+        return pd.Series(self.counts('by_weekday', selected_user), index=pd.Index(DAYS, name='day_name'),
+                         name='count')
+
+    def user_series(self):
+        """Messages per user, busiest first"""
+        counts = pd.Series(self.messages, index=self.users, name='count')
+        return counts[counts > 0].sort_values(ascending=False, kind='stable')
+
+
+@per_frame
+def chat_cube(df):
+    """ChatCube for a preprocessed DataFrame, built once per frame"""
+    with perf.span('aggregate cube', len(df)):
+        return ChatCube(df)
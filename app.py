@@ -1,9 +1,8 @@
 import streamlit as st
-import preprocessor, helper
-import matplotlib.pyplot as plt
-import seaborn as sns
+import helper, cache, perf, charts, query, compare, jobs
 import pandas as pd
-import numpy as np
+import time
+import uuid
 
 # Set page configuration
 st.set_page_config(
@@ -106,23 +105,255 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+# Every stage of this run is timed; see the optional Performance panel
+recorder = perf.start_recording()
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def chart_png(key, selected_user, chart, _draw, _args):
+    # Drawn once per chat, user and chart; later reruns only send the cached image
+    return charts.to_png(_draw(*_args))
+
+
+def render(key, selected_user, chart, draw, *args):
+    # Time rendering separately from the analysis that produced the chart
+    with perf.span(f"render {chart}"):
+        st.image(chart_png(key, selected_user, chart, draw, args), use_column_width=True)
+
+
+# ---------- Background Jobs ----------
+# Seconds between reruns while waiting on a job
+POLL_SECONDS = 0.5
+
+
+@st.cache_resource
+def job_runner():
+    # One bounded pool shared by every session; identical jobs (same content hash) run once.
+    # Parse and analysis jobs are trimmed apart, so analyses never evict a parsed chat
+    return jobs.JobRunner(max_workers=2, keep=8)
+
+
+def session_id():
+    return st.session_state.setdefault("session_id", uuid.uuid4().hex)
+
+
+def start_job(slot, key, func, *args):
+    """
+    The job for `key`, followed by this session in `slot` (parse, analysis, ...).
+    Following a new job in a slot releases the old one, which is cancelled if nobody else follows it.
+    Returns None if the user cancelled this job.
+    """
+    if key in st.session_state.setdefault("cancelled_jobs", set()):
+        return None
+    job = job_runner().submit(key, func, *args, owner=session_id(), group=slot)
+    followed = st.session_state.setdefault("jobs", {})
+    previous = followed.get(slot)
+    if previous is not None and previous is not job:
+        job_runner().release(previous, session_id())
+    followed[slot] = job
+    return job
+
+
+def wait(job, slot):
+    # Progress bar and Cancel button until the job is done; unfinished jobs end this run and poll
+    if job.done():
+        return
+    st.progress(job.progress, text=job.message)
+    if st.button("Cancel", key=f"cancel {slot}"):
+        st.session_state["cancelled_jobs"].add(job.key)
+        job_runner().release(job, session_id())
+        st.rerun()
+    time.sleep(POLL_SECONDS)
+    st.rerun()
+
+
+def cancelled(key, what):
+    # Shown in place of a cancelled job, with a button to start it again
+    st.info(f"{what} cancelled.")
+    if st.button("Restart", key=f"restart {key}"):
+        st.session_state["cancelled_jobs"].discard(key)
+        st.rerun()
+    st.stop()
+
+
+def failed(job, what, error):
+    # Shown in place of a failed job (or section), with a button to run the job again
+    st.error(f"{what} failed: {error}")
+    if st.button("Retry", key=f"retry {job.key}"):
+        job_runner().forget(job.key)
+        st.rerun()
+    st.stop()
+
+
+def parse_job(job, key, bytes_data):
+    # Keyed by content hash, so reruns and re-uploads of the same chat skip parsing
+    return cache.preprocess_cached(bytes_data, key, progress=lambda done: job.report(done, "Parsing chat..."))
+
+
+def comparison_job(job, chats, uploads):
+    # Chats are parsed concurrently on worker processes, then compared in one grouped pass.
+    # The uploads are copied (to send them to the workers) only here, not on every poll
+    job.report(0.0, "Parsing chats...")
+    sources = [upload.getvalue() for upload in uploads]
+    combined = compare.combine(compare.load_chats(dict(zip(chats, sources))))
+    job.report(0.8, "Comparing chats...")
+    return combined, compare.compare_chats(combined)
+
+
+def chat_key(uploaded_file):
+    # Hash each upload once per session instead of on every rerun
+    keys = st.session_state.setdefault("chat_keys", {})
+    if uploaded_file.file_id not in keys:
+        keys[uploaded_file.file_id] = cache.content_hash(uploaded_file.getbuffer())
+    return keys[uploaded_file.file_id]
+
+
+SINGLE, COMPARE = "Single chat", "Compare chats"
+
+
+# ---------- Deferred Analysis ----------
+OVERVIEW, TIMELINE, TEXT, SENTIMENT, REPLIES = "📊 Overview", "📅 Timeline", "📝 Text Analysis", "❤️ Sentiment", "⏱️ Replies"
+
+# Searches run in the script itself: the index is built on the chat's first search and cached with it
+SEARCH = "🔎 Search"
+
+
+def overview_data(selected_user, df):
+    stats = helper.fetch_stats(selected_user, df)
+    busy_day = helper.week_activity_map(selected_user, df)
+    busy_users = helper.most_busy_user(df) if selected_user == 'Overall' else None
+    return stats, busy_day, busy_users
+
+
+# Days averaged in the daily activity chart
+ROLLING_DAYS = 7
+
+
+def timeline_data(selected_user, df):
+    return (helper.monthly_timeline(selected_user, df), helper.hourly_activity(selected_user, df),
+            helper.activity_timeline(selected_user, df, 'day', ROLLING_DAYS), helper.activity_heatmap(selected_user, df))
+
+
+def text_data(selected_user, df):
+    return (helper.create_wordcloud(selected_user, df),
+            helper.most_common_words(selected_user, df),
+            helper.most_common_ngrams(selected_user, df, 2, 15),
+            helper.emoji_helper(selected_user, df))
+
+
+def sentiment_data(selected_user, df):
+    sentiment_counts, _ = helper.sentiment_analysis(df, selected_user)
+    return sentiment_counts, helper.sentiment_trend(selected_user, df)
+
+
+def replies_data(selected_user, df):
+    avg_response, responses = helper.response_time_analysis(df, selected_user)
+    return (avg_response, helper.response_percentiles(selected_user, df), responses['response_mins'],
+            helper.reply_matrix(df), helper.reply_summary(df), helper.conversation_sessions(selected_user, df))
+
+
+SECTIONS = {
+    OVERVIEW: overview_data,
+    TIMELINE: timeline_data,
+    TEXT: text_data,
+    SENTIMENT: sentiment_data,
+    REPLIES: replies_data,
+}
+
+
+def analysis_job(job, selected_user, df, first):
+    # Every section of a chat and user, the open one first; each is published as soon as it is done
+    sections = [first] + [section for section in SECTIONS if section != first]
+    for i, section in enumerate(sections):
+        job.report(i / len(sections), f"Analyzing {section}...")
+        try:
+            job.publish(section, SECTIONS[section](selected_user, df))
+        except Exception as e:
+            job.publish(section, e)
+    job.report(1.0, "Done")
+
+
+def section_result(job, section):
+    # Waits for this section only; the others keep running in the background
+    if section not in job.partial:
+        wait(job, "analysis")
+        if section not in job.partial:
+            failed(job, "Analysis", job.error)
+    result = job.partial[section]
+    if isinstance(result, Exception):
+        failed(job, "Analysis", result)
+    return result
+
+
 # ---------- Sidebar ----------
 with st.sidebar:
     st.title("📱 WhatsApp Analyzer")
     st.markdown("---")
 
-    st.markdown("### Upload Chat File")
-    uploaded_file = st.file_uploader(
-        "Choose your WhatsApp chat export file",
-        type=["txt"],
-        help="Export your WhatsApp chat and upload the text file here"
-    )
+    mode = st.radio("Mode", [SINGLE, COMPARE], horizontal=True)
+
+    uploaded_file, uploaded_files = None, []
+    if mode == SINGLE:
+        st.markdown("### Upload Chat File")
+        uploaded_file = st.file_uploader(
+            "Choose your WhatsApp chat export file",
+            type=["txt"],
+            help="Export your WhatsApp chat and upload the text file here"
+        )
+    else:
+        st.markdown("### Upload Chat Files")
+        uploaded_files = st.file_uploader(
+            "Choose the WhatsApp chat exports to compare",
+            type=["txt"],
+            accept_multiple_files=True,
+            help="Every chat is parsed in parallel and compared side by side"
+        )
 
 # ---------- Main Area ----------
-if uploaded_file is not None:
-    bytes_data = uploaded_file.getvalue()
-    data = bytes_data.decode("utf-8")
-    df = preprocessor.preprocess(data)
+if uploaded_files:
+    keys = tuple(chat_key(uploaded) for uploaded in uploaded_files)
+    comparison_key = "|".join(keys)
+    job = start_job("parse", f"compare {comparison_key}", comparison_job,
+                    compare.chat_ids(uploaded.name for uploaded in uploaded_files), uploaded_files)
+    if job is None:
+        cancelled(f"compare {comparison_key}", "Parsing")
+    with perf.span("load comparison") as span:
+        wait(job, "parse")
+        if job.failed:
+            failed(job, "Comparison", job.error)
+        combined, (summary, hourly, top_words) = job.result()
+        span['rows'] = len(combined)
+
+    st.title("Chat Comparison")
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("💬 Messages per Chat")
+        render(comparison_key, "Overall", "compare_messages", charts.bar, summary['chat'], summary['messages'], '#3b82f6')
+    with col2:
+        st.subheader("👥 Active Users per Chat")
+        render(comparison_key, "Overall", "compare_users", charts.bar, summary['chat'], summary['active_users'], '#10b981')
+
+    st.subheader("🕒 Hourly Profile")
+    render(comparison_key, "Overall", "compare_hourly", charts.heatmap, hourly, "Hour", "Chat", "Share of messages")
+
+    st.subheader("📊 Top Words")
+    st.dataframe(top_words.pivot(index='rank', columns='chat', values='word').reindex(columns=summary['chat']),
+                 use_container_width=True)
+
+elif uploaded_file is not None:
+    key = chat_key(uploaded_file)
+    # The upload's own buffer is parsed in place, without copying or decoding it whole
+    job = start_job("parse", f"parse {key}", parse_job, key, uploaded_file.getbuffer())
+    if job is None:
+        cancelled(f"parse {key}", "Parsing")
+    with perf.span("load chat") as span:
+        wait(job, "parse")
+        if job.failed:
+            failed(job, "Parsing", job.error)
+        df = job.result()
+        span['rows'] = len(df)
 
     user_list = df['user'].unique().tolist()
     if 'group_notification' in user_list:
@@ -132,19 +363,43 @@ if uploaded_file is not None:
 
     with st.sidebar:
         st.markdown("### Analysis Options")
-        selected_user = st.selectbox("Select User for Analysis", user_list)
+        # Optional time window and group of users; the analysis only sees their messages
+        date_range = ()
+        if len(df):
+            first_day, last_day = df['date'].min().date(), df['date'].max().date()
+            date_range = st.date_input("Date range", (first_day, last_day), min_value=first_day, max_value=last_day)
+        group = st.multiselect("Only these users", user_list[1:])
+        selected_user = st.selectbox("Select User for Analysis", ["Overall"] + group if group else user_list)
         analyze = st.button("Generate Analysis", use_container_width=True)
+        lightweight = st.checkbox("Lightweight charts", help="Interactive Streamlit charts instead of images where possible")
+        show_performance = st.checkbox("Show performance panel")
 
     if analyze:
-        # Use tabs for sections
-        tab1, tab2, tab3, tab4 = st.tabs([
-            "📊 Overview", "📅 Timeline", "📝 Text Analysis", "❤️ Sentiment"
-        ])
-
-        # Fetch stats
-        num_msgs, words, num_media, links = helper.fetch_stats(selected_user, df)
+        # Keep showing the analysis of this chat across reruns (e.g. when switching sections)
+        st.session_state["analyzed_chat"] = key
+
+    if st.session_state.get("analyzed_chat") == key:
+        chat_df, chat_hash = df, key
+        start = end = None
+        if len(date_range) == 2 and tuple(date_range) != (first_day, last_day):
+            start, end = pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)
+        if start is not None or group:
+            df = query.select(df, start, end, group or None)
+            # Analyses and charts of a selection are cached apart from the whole chat's
+            key = f"{key}|{start}|{end}|{','.join(sorted(group))}"
+
+        # Only the open section is rendered; it is analyzed first and the others follow in the background
+        section = st.radio("Section", list(SECTIONS) + [SEARCH], horizontal=True, label_visibility="collapsed")
+        analysis_key = f"analysis {key}|{selected_user}"
+        job = start_job("analysis", analysis_key, analysis_job, selected_user, df,
+                        section if section in SECTIONS else OVERVIEW)
+        if job is None:
+            cancelled(analysis_key, "Analysis")
+
+        if section == OVERVIEW:
+            with perf.span("overview analysis", len(df)):
+                (num_msgs, words, num_media, links), busy_day, busy_users = section_result(job, section)
 
-        with tab1:
             st.title("Chat Overview")
 
             col1, col2, col3, col4 = st.columns(4)
@@ -160,59 +415,74 @@ if uploaded_file is not None:
 
             with col1:
                 st.markdown("#### Most Active Day")
-                busy_day = helper.week_activity_map(selected_user, df)
-                fig, ax = plt.subplots()
-                ax.bar(busy_day.index, busy_day.values, color='#3b82f6')
-                plt.xticks(rotation=45)
-                st.pyplot(fig)
+                if lightweight:
+                    st.bar_chart(busy_day, color='#3b82f6')
+                else:
+                    render(key, selected_user, "week_activity_map", charts.bar, busy_day.index, busy_day.values, '#3b82f6')
 
             with col2:
-                if selected_user == 'Overall':
+                if busy_users is not None:
+                    x, new_df = busy_users
                     st.markdown("#### User Activity")
-                    x, new_df = helper.most_busy_user(df)
-                    fig, ax = plt.subplots()
-                    ax.bar(x.index, x.values, color='#10b981')
-                    plt.xticks(rotation=45)
-                    st.pyplot(fig)
+                    if lightweight:
+                        st.bar_chart(x, color='#10b981')
+                    else:
+                        render(key, selected_user, "most_busy_user", charts.bar, x.index, x.values, '#10b981')
                     with st.expander("📋 Detailed User Stats"):
                         st.dataframe(new_df, use_container_width=True, hide_index=True)
 
-        with tab2:
+        elif section == TIMELINE:
+            with perf.span("timeline analysis", len(df)):
+                timeline, hourly, daily, weekly_hours = section_result(job, section)
+
             st.title("Timeline Analysis")
 
             st.subheader("📈 Monthly Activity")
-            timeline = helper.monthly_timeline(selected_user, df)
-            fig, ax = plt.subplots()
-            ax.plot(timeline['time'], timeline['message'], marker='o', color='#8b5cf6')
-            plt.xticks(rotation=45)
-            st.pyplot(fig)
+            # Long chats are binned to a bounded number of points
+            points, months_per_bin = charts.month_points(timeline, 'message')
+            if lightweight:
+                st.line_chart(points, color='#8b5cf6')
+            else:
+                render(key, selected_user, "monthly_timeline", charts.timeline, points, months_per_bin, '#8b5cf6', "Messages")
 
             st.subheader("🕒 Hourly Activity Pattern")
-            hourly = helper.hourly_activity(selected_user, df)
-            fig, ax = plt.subplots()
-            ax.plot(hourly.index, hourly.values, marker='o', color='#8b5cf6')
-            plt.xticks(range(24))
-            st.pyplot(fig)
+            if lightweight:
+                st.line_chart(hourly, x='hour', y='message', color='#8b5cf6')
+            else:
+                render(key, selected_user, "hourly_activity", charts.hourly, hourly)
+
+            st.subheader(f"📆 Daily Activity ({ROLLING_DAYS}-day average)")
+            if lightweight:
+                st.line_chart(daily, color='#8b5cf6')
+            else:
+                render(key, selected_user, "daily_activity", charts.timeline, daily, 1, '#8b5cf6', "Messages per day")
+
+            st.subheader("🗓️ Weekly Activity Heatmap")
+            render(key, selected_user, "activity_heatmap", charts.heatmap, weekly_hours, "Hour", "Day", "Messages")
+
+        elif section == TEXT:
+            with perf.span("text analysis", len(df)):
+                df_wc, most_common, phrases, emoji_df = section_result(job, section)
 
-        with tab3:
             st.title("Text Analysis")
 
             st.subheader("☁️ Word Cloud")
-            df_wc = helper.create_wordcloud(selected_user, df)
-            fig, ax = plt.subplots()
-            ax.imshow(df_wc)
-            ax.axis('off')
-            st.pyplot(fig)
+            render(key, selected_user, "wordcloud", charts.image, df_wc)
 
             st.subheader("📊 Most Common Words")
-            most_common = helper.most_common_words(selected_user, df)
-            fig, ax = plt.subplots()
-            ax.barh(most_common['Word'][:15], most_common['Count'][:15], color='#6366f1')
-            plt.tight_layout()
-            st.pyplot(fig)
+            if lightweight:
+                st.bar_chart(most_common.head(15), x='Word', y='Count', color='#6366f1')
+            else:
+                render(key, selected_user, "most_common_words", charts.bar, most_common['Word'][:15],
+                       most_common['Count'][:15], '#6366f1', True)
+
+            st.subheader("💬 Most Common Phrases")
+            if not phrases.empty:
+                st.dataframe(phrases, use_container_width=True, hide_index=True)
+            else:
+                st.info("No phrases found")
 
             st.subheader("😊 Emoji Analysis")
-            emoji_df = helper.emoji_helper(selected_user, df)
             if not emoji_df.empty:
                 col1, col2 = st.columns(2)
                 with col1:
@@ -220,39 +490,113 @@ if uploaded_file is not None:
                 with col2:
                     if len(emoji_df) > 8:
                         emoji_df = emoji_df.head(8)
-                    fig, ax = plt.subplots()
-                    plt.pie(emoji_df[1], labels=[f"Top {i+1}" for i in range(len(emoji_df))],
-                            autopct='%1.1f%%', colors=plt.cm.Pastel1(np.linspace(0, 1, len(emoji_df))))
-                    st.pyplot(fig)
+                    render(key, selected_user, "emoji_pie", charts.pie, emoji_df[1],
+                           [f"Top {i+1}" for i in range(len(emoji_df))],
+                           charts.palette('Pastel1', len(emoji_df)))
             else:
                 st.info("No emojis found")
 
-        with tab4:
+        elif section == SENTIMENT:
             st.title("Sentiment Analysis")
 
             try:
-                sentiment_counts, sentiment_df = helper.sentiment_analysis(df, selected_user)
+                with perf.span("sentiment analysis", len(df)):
+                    sentiment_counts, monthly_sentiment = section_result(job, section)
                 col1, col2 = st.columns(2)
 
                 with col1:
                     st.subheader("😊 Message Sentiment")
-                    fig, ax = plt.subplots()
                     colors = ['#10b981', '#ef4444', '#6b7280']
                     sentiment_series = pd.Series(sentiment_counts)
-                    plt.pie(sentiment_series.values, labels=sentiment_series.index, autopct='%1.1f%%', colors=colors)
-                    st.pyplot(fig)
+                    render(key, selected_user, "sentiment_pie", charts.pie, sentiment_series.values,
+                           sentiment_series.index, colors)
 
                 with col2:
                     st.subheader("📈 Sentiment Trends")
-                    monthly_sentiment = sentiment_df.groupby(['year', 'month_num'])['sentiment'].mean().reset_index()
-                    monthly_sentiment['month_year'] = monthly_sentiment.apply(lambda x: f"{x['month_num']}-{x['year']}", axis=1)
-                    fig, ax = plt.subplots()
-                    plt.plot(monthly_sentiment['month_year'], monthly_sentiment['sentiment'], marker='o', color='#8b5cf6')
-                    plt.xticks(rotation=45)
-                    st.pyplot(fig)
-
-            except:
-                st.error("Sentiment analysis failed. Make sure `vaderSentiment` is installed.")
+                    points, months_per_bin = charts.month_points(monthly_sentiment, 'sentiment', how='mean')
+                    if lightweight:
+                        st.line_chart(points, color='#8b5cf6')
+                    else:
+                        render(key, selected_user, "sentiment_trend", charts.timeline, points, months_per_bin,
+                               '#8b5cf6', "Mean sentiment")
+
+            except Exception as e:
+                st.error(f"Sentiment analysis failed: {e}")
+
+        elif section == REPLIES:
+            with perf.span("reply analysis", len(df)):
+                avg_response, percentiles, latencies, matrix, summary, sessions = section_result(job, section)
+
+            st.title("Response Times")
+
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Average Reply", f"{avg_response:,.1f} min")
+            col2.metric("Median (p50)", f"{percentiles['p50']:,.1f} min" if latencies.size else "–")
+            col3.metric("p90", f"{percentiles['p90']:,.1f} min" if latencies.size else "–")
+            col4.metric("p99", f"{percentiles['p99']:,.1f} min" if latencies.size else "–")
+
+            st.markdown("---")
+            col1, col2 = st.columns(2)
+
+            with col1:
+                st.subheader("⏳ Reply Latency Distribution")
+                if latencies.size:
+                    render(key, selected_user, "reply_latency", charts.histogram, latencies, 50, '#3b82f6', "Minutes")
+                else:
+                    st.info("No replies found")
+
+            with col2:
+                st.subheader("🔁 Who Replies to Whom")
+                if not matrix.empty:
+                    render(key, selected_user, "reply_matrix", charts.heatmap, matrix, "Replying to", "Reply from",
+                           "Median minutes")
+                else:
+                    st.info("No replies found")
+
+            st.subheader("💬 Conversation Sessions")
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Sessions", f"{len(sessions):,}")
+            col2.metric("Median Length", f"{sessions['duration_mins'].median():,.0f} min" if len(sessions) else "–")
+            col3.metric("Median Messages", f"{sessions['messages'].median():,.0f}" if len(sessions) else "–")
+
+            with st.expander("📋 Reply Stats per User"):
+                st.dataframe(summary.round(1), use_container_width=True, hide_index=True)
+
+        elif section == SEARCH:
+            st.title("Search Messages")
+
+            search_text = st.text_input("Word or phrase", placeholder="e.g. good morning, or a link")
+            if search_text.strip():
+                with perf.span("search", len(df)):
+                    cache.search_index_cached(chat_df, chat_hash)
+                    if df is not chat_df:
+                        # The same selection, now with the chat's search index sliced for it
+                        df = query.select(chat_df, start, end, group or None)
+                    found, results = helper.search_messages(search_text, selected_user, df)
+                    mentions = helper.search_timeline(search_text, selected_user, df)
+
+                st.metric("Matching Messages", f"{found:,}")
+                if found:
+                    st.subheader("📈 Mentions Over Time")
+                    if lightweight:
+                        st.line_chart(mentions, color='#8b5cf6')
+                    else:
+                        render(key, selected_user, f"search {search_text}", charts.timeline, mentions, 1,
+                               '#8b5cf6', "Messages per month")
+
+                    st.subheader("💬 Latest Matches")
+                    st.dataframe(results, use_container_width=True, hide_index=True)
+                else:
+                    st.info("No messages found")
+
+    if show_performance:
+        with st.sidebar:
+            st.markdown("### Performance")
+            # This run's stages, then those of the jobs it follows (which run on the job pool)
+            timings = recorder.merged({f"{slot} job": job.recorder for slot, job in st.session_state["jobs"].items()})
+            st.dataframe(timings.to_frame(), use_container_width=True, hide_index=True)
+            st.download_button("Download timings (JSON lines)", timings.to_json_lines(),
+                               file_name="performance.jsonl", mime="application/json")
 
 else:
     st.markdown("""
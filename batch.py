@@ -0,0 +1,161 @@
+"""
+Headless batch analysis of WhatsApp chat exports.
+
+    python batch.py exports/ -o results/ --workers 8 --summary results/summary.parquet
+    python batch.py exports/ --compare results/comparison.csv
+
+Every .txt file in the input directory is parsed and analyzed on a process pool;
+the metrics of each chat are written to <output>/<chat>.json. No charts are rendered,
+so streamlit, wordcloud and matplotlib are never imported. With --compare, the chats
+are instead combined and compared side by side (see compare.py).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import preprocessor, helper, perf, compare
+
+
+def user_metrics(selected_user, df):
+    """Scalar metrics of one user (or 'Overall')"""
+    num_msgs, words, num_media, links = helper.fetch_stats(selected_user, df)
+    sentiment_counts, _ = helper.sentiment_analysis(df, selected_user)
+    avg_response, _ = helper.response_time_analysis(df, selected_user)
+    percentiles = helper.response_percentiles(selected_user, df)
+
+    return {
+        'messages': num_msgs,
+        'words': words,
+        'media': num_media,
+        'links': links,
+        'sentiment': {label: int(count) for label, count in sentiment_counts.items()},
+        'avg_response_mins': float(avg_response),
+        **{f'response_{name}_mins': None if np.isnan(value) else round(value, 2) for name, value in percentiles.items()},
+    }
+
+
+def analyze_chat(df, top_n=20):
+    """All metrics shown by the app, as plain JSON-serializable values"""
+    users = sorted(u for u in df['user'].unique().tolist() if u != 'group_notification')
+
+    timeline = helper.monthly_timeline('Overall', df)
+    hourly = helper.hourly_activity('Overall', df)
+    busy_day = helper.week_activity_map('Overall', df)
+    _, busy_users = helper.most_busy_user(df)
+    common_words = helper.most_common_words('Overall', df)
+    emoji_df = helper.emoji_helper('Overall', df)
+
+    return {
+        'overall': user_metrics('Overall', df),
+        'users': {user: user_metrics(user, df) for user in users},
+        'monthly_timeline': dict(zip(timeline['time'], timeline['message'].astype(int).tolist())),
+        'hourly_activity': dict(zip(hourly['hour'].astype(int).tolist(), hourly['message'].astype(int).tolist())),
+        'week_activity': {day: int(count) for day, count in busy_day.items()},
+        'user_share': dict(zip(busy_users['User'], busy_users['Percent of Messages'].astype(float).tolist())),
+        'most_common_words': dict(zip(common_words['Word'], common_words['Count'].astype(int).tolist())),
+        'top_emojis': dict(zip(emoji_df[0].head(top_n), emoji_df[1].head(top_n).astype(int).tolist())),
+    }
+
+
+def analyze_file(path, output_dir, encoding='utf-8'):
+    """Worker: parse and analyze one export, write its JSON and return a summary row per user"""
+    chat = os.path.splitext(os.path.basename(path))[0]
+    start = time.perf_counter()
+
+    with perf.recording() as recorder:
+        with perf.span('preprocess') as span:
+            df = preprocessor.preprocess_file(path, encoding=encoding, compact=True)
+            span['rows'] = len(df)
+        with perf.span('analyze', len(df)):
+            metrics = analyze_chat(df)
+    metrics['chat'] = chat
+    metrics['seconds'] = round(time.perf_counter() - start, 3)
+    metrics['timings'] = recorder.spans
+
+    with open(os.path.join(output_dir, chat + '.json'), 'w', encoding='utf-8') as f:
+        json.dump(metrics, f, ensure_ascii=False, indent=2)
+
+    rows = []
+    for user, values in [('Overall', metrics['overall'])] + list(metrics['users'].items()):
+        row = {'chat': chat, 'user': user}
+        row.update({key: value for key, value in values.items() if key != 'sentiment'})
+        row.update({f'sentiment_{label.lower()}': count for label, count in values['sentiment'].items()})
+        rows.append(row)
+    return rows
+
+
+def find_exports(input_dir):
+    return sorted(os.path.join(input_dir, name) for name in os.listdir(input_dir)
+                  if name.lower().endswith('.txt'))
+
+
+def write_summary(rows, path):
+    summary = pd.DataFrame(rows)
+    summary.columns = summary.columns.astype(str)
+    if path.endswith('.parquet'):
+        summary.to_parquet(path, index=False)
+    elif path.endswith('.json'):
+        summary.to_json(path, orient='records', force_ascii=False)
+    else:
+        summary.to_csv(path, index=False)
+
+
+def write_comparison(paths, path, workers=None, encoding='utf-8'):
+    """Compare chats and write the summary to `path`, hourly profiles and top words next to it"""
+    frames = compare.load_chats(dict(zip(compare.chat_ids(paths), paths)), workers, encoding)
+    summary, hourly, top_words = compare.compare_chats(compare.combine(frames))
+
+    stem, ext = os.path.splitext(path)
+    write_summary(summary, path)
+    write_summary(hourly.reset_index(), f"{stem}.hourly{ext}")
+    write_summary(top_words, f"{stem}.top_words{ext}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a directory of WhatsApp chat exports without the web app")
+    parser.add_argument('input_dir', help="directory containing exported .txt chats")
+    parser.add_argument('-o', '--output-dir', default='results', help="where per-chat JSON metrics are written")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument('--summary', help="also write one row per chat and user (.parquet, .json or .csv)")
+    parser.add_argument('--compare', help="instead, compare the chats side by side and write the comparison here")
+    parser.add_argument('--encoding', default='utf-8')
+    args = parser.parse_args(argv)
+
+    paths = find_exports(args.input_dir)
+    if not paths:
+        print(f"No .txt exports found in {args.input_dir}", file=sys.stderr)
+        return 1
+
+    if args.compare:
+        write_comparison(paths, args.compare, args.workers, args.encoding)
+        print(f"{len(paths)} chats compared")
+        return 0
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    rows = []
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(analyze_file, path, args.output_dir, args.encoding): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                rows.extend(future.result())
+                print(f"Analyzed {path}")
+            except Exception as e:
+                failed += 1
+                print(f"Error analyzing {path}: {e}", file=sys.stderr)
+
+    if args.summary and rows:
+        write_summary(rows, args.summary)
+
+    print(f"{len(paths) - failed}/{len(paths)} chats analyzed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+Benchmarks for preprocess and the helper analytics on synthetic chats.
+
+    python bench.py --sizes 10000,100000,1000000 --memory -o bench_results.jsonl
+    python bench.py --compare bench_results.jsonl new_results.jsonl
+
+Every stage runs on a fresh view of the frame, so memoized indexes and aggregates
+are rebuilt and each timing is the cold cost a user sees. Results are appended as
+JSON lines tagged with the current commit so runs can be compared.
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import preprocessor, helper, synthetic
+
+STAGES = {
+    'fetch_stats': lambda df: helper.fetch_stats('Overall', df),
+    'wordcloud': lambda df: helper.create_wordcloud('Overall', df),
+    'most_common_words': lambda df: helper.most_common_words('Overall', df),
+    'emoji_helper': lambda df: helper.emoji_helper('Overall', df),
+    'sentiment': lambda df: helper.sentiment_analysis(df, 'Overall'),
+    'response_time': lambda df: helper.response_time_analysis(df, 'Overall'),
+}
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def measure(func, memory=False):
+    """(seconds, peak traced MB or None, result) of one call"""
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+    return seconds, peak, result
+
+
+def run(sizes, stages=None, memory=False, compact=True, **chat_options):
+    """Benchmark every stage at every size; yields one result dict per (size, stage)"""
+    stages = stages or ['parse'] + list(STAGES)
+    commit = current_commit()
+    started = datetime.datetime.now().isoformat(timespec='seconds')
+
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'chat.txt')
+            synthetic.write_chat(path, size, **chat_options)
+            parse = lambda: preprocessor.preprocess_file(path, compact=compact)
+
+            if 'parse' in stages:
+                seconds, peak, df = measure(parse, memory)
+                yield _result(commit, started, size, 'parse', seconds, peak, len(df), chat_options)
+            else:
+                df = parse()
+
+        for stage in stages:
+            if stage == 'parse':
+                continue
+            # A shallow copy is a new frame for the per-frame memos
+            view = df.copy(deep=False)
+            seconds, peak, _ = measure(lambda: STAGES[stage](view), memory)
+            yield _result(commit, started, size, stage, seconds, peak, len(df), chat_options)
+
+
+def _result(commit, started, size, stage, seconds, peak, rows, chat_options):
+    return {'commit': commit, 'started': started, 'messages': size, 'stage': stage, 'rows': rows,
+            'seconds': round(seconds, 4), 'peak_mb': None if peak is None else round(peak, 1),
+            'options': {key: str(value) for key, value in chat_options.items()}}
+
+
+def load_results(path):
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(old_path, new_path):
+    """Print the time ratio of every (size, stage) present in both result files"""
+    old = {(r['messages'], r['stage']): r for r in load_results(old_path)}
+    new = {(r['messages'], r['stage']): r for r in load_results(new_path)}
+
+    print(f"{'messages':>10}  {'stage':<18} {'old s':>9} {'new s':>9} {'ratio':>7}")
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key]['seconds'], new[key]['seconds']
+        ratio = after / before if before else float('inf')
+        print(f"{key[0]:>10}  {key[1]:<18} {before:>9.3f} {after:>9.3f} {ratio:>6.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark preprocess and the helper analytics")
+    parser.add_argument('--sizes', default='10000,100000', help="comma-separated message counts")
+    parser.add_argument('--stages', help="comma-separated subset of: parse," + ','.join(STAGES))
+    parser.add_argument('--memory', action='store_true', help="also record peak traced memory (slower)")
+    parser.add_argument('--full-schema', action='store_true', help="parse without the compact schema")
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--multiline-ratio', type=float, default=0.05)
+    parser.add_argument('--emoji-density', type=float, default=0.2)
+    parser.add_argument('--url-density', type=float, default=0.02)
+    parser.add_argument('--clock', choices=['12h', '24h'], default='12h')
+    parser.add_argument('--locale', choices=sorted(synthetic.LOCALES), default='dmy')
+    parser.add_argument('-o', '--output', help="append results as JSON lines to this file")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    stages = args.stages.split(',') if args.stages else None
+    unknown = set(stages or []) - set(STAGES) - {'parse'}
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    chat_options = dict(users=args.users, multiline_ratio=args.multiline_ratio, emoji_density=args.emoji_density,
+                        url_density=args.url_density, clock=args.clock, locale=args.locale)
+
+    output = open(args.output, 'a') if args.output else None
+    try:
+        for result in run(sizes, stages, args.memory, not args.full_schema, **chat_options):
+            peak = '' if result['peak_mb'] is None else f"  {result['peak_mb']:>8.1f} MB"
+            print(f"{result['messages']:>10}  {result['stage']:<18} {result['seconds']:>9.3f} s{peak}")
+            if output:
+                output.write(json.dumps(result) + '\n')
+                output.flush()
+    finally:
+        if output:
+            output.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
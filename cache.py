@@ -0,0 +1,285 @@
+import os
+import json
+import hashlib
+import pandas as pd
+import preprocessor
+import perf
+from aggregates import ChatCube, chat_cube
+from search import SearchIndex, search_index
+
+# Where parsed chats are kept between runs (override with CHAT_ANALYZER_CACHE)
+CACHE_DIR = os.environ.get(
+    'CHAT_ANALYZER_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'chat_analyzer')
+)
+
+# Total size of the cache on disk before the least recently used chats are evicted
+MAX_CACHE_BYTES = int(os.environ.get('CHAT_ANALYZER_CACHE_BYTES', 1024 ** 3))
+
+# Files stored per chat: the parsed frame, its aggregate cube, its search index and a
+# manifest describing the export it came from (used to ingest re-exports incrementally)
+CACHE_SUFFIX = '.parquet'
+CUBE_SUFFIX = '.cube.npz'
+SEARCH_SUFFIX = '.search.npz'
+MANIFEST_SUFFIX = '.json'
+
+# Size of the export head compared before hashing a whole candidate prefix
+HEAD_BYTES = 4096
+
+
+def content_hash(data):
+    """Stable key for an upload (bytes-like or str)"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def cache_path(key, suffix=CACHE_SUFFIX):
+    return os.path.join(CACHE_DIR, key + suffix)
+
+
+def load(key):
+    """Return the cached DataFrame for `key`, or None if it isn't cached"""
+    path = cache_path(key)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        df = pd.read_parquet(path)
+    except Exception as e:
+        print(f"Error reading cached chat: {e}")
+        return None
+
+    # Parquet gives an empty categorical column back as object
+    if not isinstance(df['user'].dtype, pd.CategoricalDtype):
+        df['user'] = df['user'].astype('category')
+
+    # Touch the file so eviction sees it as recently used
+    os.utime(path)
+    return df
+
+
+def load_cube(key):
+    """Return the cached ChatCube for `key`, or None if it isn't cached"""
+    path = cache_path(key, CUBE_SUFFIX)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        return ChatCube.load(path)
+    except Exception as e:
+        print(f"Error reading cached aggregates: {e}")
+        return None
+
+
+def load_search(key):
+    """Return the cached SearchIndex for `key`, or None if it isn't cached"""
+    path = cache_path(key, SEARCH_SUFFIX)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        return SearchIndex.load(path)
+    except Exception as e:
+        print(f"Error reading cached search index: {e}")
+        return None
+
+
+def load_manifest(key):
+    try:
+        with open(cache_path(key, MANIFEST_SUFFIX), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def store(key, df, cube=None, manifest=None, search=None):
+    """Write a parsed chat to the cache and evict old entries if it grew too big"""
+    path = cache_path(key)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write to a temporary file first so readers never see a partial file
+        tmp_path = path + '.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+        if cube is not None:
+            tmp_path = cache_path(key, '.tmp.npz')
+            cube.save(tmp_path)
+            os.replace(tmp_path, cache_path(key, CUBE_SUFFIX))
+
+        if search is not None:
+            store_search(key, search)
+
+        if manifest is not None:
+            with open(cache_path(key, MANIFEST_SUFFIX), 'w') as f:
+                json.dump(manifest, f)
+    except Exception as e:
+        print(f"Error caching chat: {e}")
+        return
+
+    evict()
+
+
+def store_search(key, index):
+    """Write the SearchIndex of a cached chat next to it"""
+    try:
+        tmp_path = cache_path(key, '.tmp.npz')
+        index.save(tmp_path)
+        os.replace(tmp_path, cache_path(key, SEARCH_SUFFIX))
+    except Exception as e:
+        print(f"Error caching search index: {e}")
+
+
+def search_index_cached(df, key):
+    """
+    search_index of the cached chat `key`. Building it costs about half a parse, so it is built
+    on the chat's first search rather than when the chat is parsed, and stored with the chat.
+    """
+    index = search_index.peek(df)
+    if index is None:
+        index = load_search(key)
+        if index is None:
+            index = search_index(df)
+            store_search(key, index)
+        search_index.seed(df, index)
+    return index
+
+
+def evict(max_bytes=MAX_CACHE_BYTES):
+    """Delete the files of least recently used chats until the cache fits in `max_bytes`"""
+    try:
+        entries = [entry for entry in os.scandir(CACHE_DIR) if entry.is_file()]
+    except FileNotFoundError:
+        return
+
+    # All files of a chat share its key and are evicted together
+    chats = {}
+    for entry in entries:
+        stat = entry.stat()
+        files, size, used = chats.get(entry.name.split('.')[0], ([], 0, 0))
+        files.append(entry.path)
+        chats[entry.name.split('.')[0]] = (files, size + stat.st_size, max(used, stat.st_mtime))
+
+    total = sum(size for _, size, _ in chats.values())
+    for files, size, _ in sorted(chats.values(), key=lambda chat: chat[2]):
+        if total <= max_bytes:
+            break
+        total -= size
+        for path in files:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _manifest(bytes_data, formats):
+    return {
+        'bytes': len(bytes_data),
+        'head_hash': content_hash(bytes_data[:HEAD_BYTES]),
+        'last_offset': preprocessor.last_message_offset(bytes_data),
+        'formats': formats,
+    }
+
+
+def find_prefix(bytes_data):
+    """Key and manifest of the longest cached export that `bytes_data` starts with, or (None, None)"""
+    try:
+        names = os.listdir(CACHE_DIR)
+    except FileNotFoundError:
+        return None, None
+
+    candidates = []
+    for name in names:
+        if not name.endswith(MANIFEST_SUFFIX):
+            continue
+        key = name[:-len(MANIFEST_SUFFIX)]
+        manifest = load_manifest(key)
+        if (manifest and manifest.get('last_offset') is not None and manifest['formats']
+                and manifest['bytes'] < len(bytes_data)
+                and manifest['head_hash'] == content_hash(bytes_data[:min(HEAD_BYTES, manifest['bytes'])])):
+            candidates.append((manifest['bytes'], key, manifest))
+
+    # A cached chat's key is the hash of its whole export, so a matching prefix hash proves the match
+    view = memoryview(bytes_data)
+    for size, key, manifest in sorted(candidates, reverse=True, key=lambda candidate: candidate[0]):
+        if content_hash(view[:size]) == key and os.path.exists(cache_path(key)):
+            return key, manifest
+
+    return None, None
+
+
+def preprocess_incremental(bytes_data, key=None, progress=None):
+    """
+    Parse a re-export of a cached chat by parsing only what follows the cached prefix.
+    Returns (df, cube), or (None, None) when no cached export is a prefix of `bytes_data`.
+    """
+    base_key, manifest = find_prefix(bytes_data)
+    if base_key is None:
+        return None, None
+
+    base_df = load(base_key)
+    cube = load_cube(base_key)
+    # Searched chats have a search index, which is extended too; others get one on their first search
+    index = load_search(base_key)
+    if base_df is None or base_df.empty:
+        return None, None
+    if cube is None:
+        cube = ChatCube(base_df)
+
+    # Re-parse from the start of the cached chat's last message, in case it continued
+    tail_df = preprocessor.preprocess_buffer(bytes_data, compact=True, formats=manifest['formats'],
+                                             start=manifest['last_offset'], progress=progress)
+
+    last = base_df.iloc[-1]
+    first = tail_df.iloc[0] if len(tail_df) else None
+    if first is not None and (first['date'], first['user'], first['message']) == (last['date'], last['user'], last['message']):
+        new_rows = tail_df.iloc[1:]
+    else:
+        new_rows = tail_df
+        cube.update(base_df.iloc[-1:], sign=-1)
+        base_df = base_df.iloc[:-1]
+
+    df = preprocessor.append(base_df, new_rows)
+    cube.update(new_rows)
+    if index is not None:
+        index.append(SearchIndex(new_rows), len(base_df))
+        search_index.seed(df, index)
+
+    store(key or content_hash(bytes_data), df, cube, _manifest(bytes_data, manifest['formats']), index)
+    return df, cube
+
+
+def preprocess_cached(bytes_data, key=None, progress=None):
+    """
+    preprocessor.preprocess with a persistent cache keyed by the upload's content hash.
+    Re-exports of a cached chat only parse their new messages.
+    `progress` is called with the fraction of the export parsed so far.
+    """
+    if key is None:
+        key = content_hash(bytes_data)
+
+    with perf.span('cache load') as span:
+        df = load(key)
+        if df is not None:
+            span['rows'] = len(df)
+            cube = load_cube(key)
+            if cube is not None:
+                chat_cube.seed(df, cube)
+            return df
+
+    with perf.span('incremental parse') as span:
+        df, cube = preprocess_incremental(bytes_data, key, progress)
+        span['rows'] = None if df is None else len(df)
+
+    if df is None:
+        # The upload is scanned as bytes; only message slices are decoded
+        with perf.span('preprocess') as span:
+            df = preprocessor.preprocess_buffer(bytes_data, compact=True, progress=progress)
+            span['rows'] = len(df)
+        cube = chat_cube(df)
+        with perf.span('cache store', len(df)):
+            store(key, df, cube, _manifest(bytes_data, df.attrs['formats']))
+
+    chat_cube.seed(df, cube)
+    return df
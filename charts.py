@@ -0,0 +1,122 @@
+"""
+Figures of the app, drawn to PNG bytes so they can be cached per chat, user and chart.
+
+Figures are created with matplotlib's object API instead of pyplot: they never enter
+pyplot's global registry, so nothing accumulates across reruns and concurrent sessions
+don't share state. Long timelines are binned so every chart has a bounded number of points.
+"""
+import io
+import math
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+# Most points drawn on a timeline before months are binned together
+MAX_POINTS = 120
+
+DPI = 150
+
+
+def to_png(fig):
+    """Render a figure to PNG bytes and release it"""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=DPI, bbox_inches='tight')
+    fig.clear()
+    return buffer.getvalue()
+
+
+def month_points(frame, value, how='sum', max_points=MAX_POINTS):
+    """
+    `value` of a frame with 'year' and 'month_num' columns on a date axis, with months
+    grouped into equal bins (summed or averaged) when the chat spans more than `max_points`.
+    Returns (points indexed by the first day of each bin, months per bin).
+    """
+    months = frame['year'].to_numpy().astype(np.int64) * 12 + frame['month_num'].to_numpy() - 1
+    values = frame[value].to_numpy().astype(np.float64)
+    if months.size == 0:
+        return pd.Series(values, index=pd.DatetimeIndex([], name='date'), name=value), 1
+
+    first = months.min()
+    size = max(1, math.ceil((months.max() - first + 1) / max_points))
+    bins, inverse = np.unique((months - first) // size, return_inverse=True)
+    totals = np.bincount(inverse, weights=values)
+    if how == 'mean':
+        totals /= np.bincount(inverse)
+
+    starts = first + bins * size
+    dates = pd.to_datetime(pd.DataFrame({'year': starts // 12, 'month': starts % 12 + 1, 'day': 1}))
+    return pd.Series(totals, index=pd.DatetimeIndex(dates, name='date'), name=value), size
+
+
+def _bin_label(size):
+    return "" if size == 1 else f" ({size}-month bins)"
+
+
+def bar(labels, values, color, horizontal=False):
+    fig = Figure()
+    ax = fig.subplots()
+    if horizontal:
+        ax.barh(labels, values, color=color)
+    else:
+        ax.bar(labels, values, color=color)
+        ax.tick_params(axis='x', labelrotation=45)
+    return fig
+
+
+def timeline(points, size, color='#8b5cf6', ylabel=None):
+    fig = Figure()
+    ax = fig.subplots()
+    ax.plot(points.index, points.values, marker='o' if len(points) <= 36 else None, color=color)
+    if ylabel:
+        ax.set_ylabel(ylabel + _bin_label(size))
+    fig.autofmt_xdate()
+    return fig
+
+
+def hourly(hourly_df, color='#8b5cf6'):
+    fig = Figure()
+    ax = fig.subplots()
+    ax.plot(hourly_df['hour'], hourly_df['message'], marker='o', color=color)
+    ax.set_xticks(range(24))
+    return fig
+
+
+def image(array):
+    fig = Figure()
+    ax = fig.subplots()
+    ax.imshow(array)
+    ax.axis('off')
+    return fig
+
+
+def palette(name, n):
+    """n colors spread over a matplotlib colormap"""
+    from matplotlib import colormaps
+    return colormaps[name](np.linspace(0, 1, n))
+
+
+def pie(values, labels, colors):
+    fig = Figure()
+    ax = fig.subplots()
+    ax.pie(values, labels=labels, autopct='%1.1f%%', colors=colors)
+    return fig
+
+
+def histogram(values, bins=50, color='#3b82f6', xlabel=None):
+    fig = Figure()
+    ax = fig.subplots()
+    ax.hist(values, bins=bins, color=color)
+    if xlabel:
+        ax.set_xlabel(xlabel)
+    return fig
+
+
+def heatmap(matrix, xlabel=None, ylabel=None, label=None):
+    import seaborn as sns
+
+    fig = Figure()
+    ax = fig.subplots()
+    sns.heatmap(matrix, ax=ax, cmap='viridis', cbar_kws={'label': label} if label else None)
+    ax.set_xlabel(xlabel or '')
+    ax.set_ylabel(ylabel or '')
+    return fig
@@ -0,0 +1,27 @@
+"""
+The `user` and `date` columns of a preprocessed DataFrame as the numpy arrays the
+per-chat indexes (ChatCube, ReplyIndex, ChatIndex, TimeBuckets, n-grams) are built from.
+"""
+import numpy as np
+import pandas as pd
+
+NS_PER_MIN = 60 * 10 ** 9
+
+
+def user_codes(df):
+    """
+    (int64 code of every message's user, Index of the users by code). A categorical `user`
+    column (compact frames) already has its codes; any other is factorized.
+    """
+    if isinstance(df['user'].dtype, pd.CategoricalDtype):
+        return df['user'].cat.codes.to_numpy().astype(np.int64), pd.Index(df['user'].cat.categories, dtype=object)
+    codes, users = pd.factorize(df['user'])
+    return codes.astype(np.int64), pd.Index(users, dtype=object)
+
+
+def time_order(times):
+    """Stable order that sorts message times, or None if they are sorted already"""
+    # Exports are in order already; only sort (stably) if they are not
+    if np.all(times[1:] >= times[:-1]):
+        return None
+    return np.argsort(times, kind='stable')
@@ -0,0 +1,124 @@
+"""
+Side-by-side comparison of many chats.
+
+Exports are parsed on a shared process pool and combined into one frame with a
+categorical `chat` column; every comparison metric is then a single grouped pass
+over that frame instead of one run of every helper per chat.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+import pandas as pd
+import preprocessor, cache, perf
+from aggregates import message_features
+from tokens import token_index
+
+
+def _load(source, encoding='utf-8'):
+    # Worker: raw export bytes go through the parse cache, anything else is a path
+    if isinstance(source, bytes):
+        return cache.preprocess_cached(source)
+    return preprocessor.preprocess_file(source, encoding=encoding, compact=True)
+
+
+def load_chats(sources, workers=None, encoding='utf-8'):
+    """
+    Parse {chat id: export bytes or path} concurrently into {chat id: frame}.
+    A single chat is parsed in this process. `encoding` applies to exports read from paths.
+    """
+    if len(sources) <= 1 or workers == 1:
+        return {chat: _load(source, encoding) for chat, source in sources.items()}
+
+    workers = min(workers or os.cpu_count() or 1, len(sources))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=preprocessor.MP_CONTEXT) as executor:
+        return dict(zip(sources, executor.map(_load, sources.values(), repeat(encoding))))
+
+
+def chat_ids(names):
+    """Chat ids from file names: the name without its extension, made unique"""
+    ids = []
+    for name in names:
+        chat = os.path.splitext(os.path.basename(name))[0]
+        base, n = chat, 2
+        while chat in ids:
+            chat, n = f"{base} ({n})", n + 1
+        ids.append(chat)
+    return ids
+
+
+def combine(frames):
+    """One frame of {chat id: frame} with a categorical `chat` column, in the given order"""
+    chats = list(frames)
+    parts = []
+    for code, chat in enumerate(chats):
+        frame = frames[chat].copy(deep=False)
+        frame['chat'] = pd.Categorical.from_codes(np.full(len(frame), code, dtype=np.int16), categories=chats)
+        parts.append(frame)
+    if not parts:
+        return pd.DataFrame(columns=preprocessor.COMPACT_COLUMNS + ['chat'])
+    return preprocessor.concat(parts)
+
+
+def compare_chats(combined, top_n=10):
+    """
+    Metrics of every chat of a combined frame:
+    (summary per chat, hourly message share per chat, top `top_n` words per chat).
+    """
+    with perf.span('compare chats', len(combined)):
+        chats = combined['chat'].cat.categories
+        n_chats = len(chats)
+        chat_codes = combined['chat'].cat.codes.to_numpy().astype(np.int64)
+        senders = (combined['user'] != 'group_notification').to_numpy()
+
+        # Message volume, words, media and links per chat
+        features = message_features(combined)
+        summary = pd.DataFrame({'chat': chats}, index=pd.RangeIndex(n_chats))
+        summary['messages'] = np.bincount(chat_codes, minlength=n_chats)
+        for name in ('words', 'media', 'links', 'emojis'):
+            summary[name] = np.bincount(chat_codes, weights=features[name], minlength=n_chats).astype(np.int64)
+
+        # Active users: distinct (chat, user) pairs among real senders
+        user_codes, users = pd.factorize(combined['user'])
+        n_users = max(len(users), 1)
+        pairs = np.unique(chat_codes[senders] * n_users + user_codes[senders])
+        summary['active_users'] = np.bincount(pairs // n_users, minlength=n_chats)
+
+        dates = combined['date'].to_numpy(dtype='datetime64[ns]')
+        order = np.argsort(chat_codes, kind='stable')
+        starts = np.searchsorted(chat_codes[order], np.arange(n_chats))
+        present = np.bincount(chat_codes, minlength=n_chats) > 0
+        sorted_dates = dates[order]
+        summary['first_message'] = pd.NaT
+        summary['last_message'] = pd.NaT
+        if present.any():
+            summary.loc[present, 'first_message'] = np.minimum.reduceat(sorted_dates, starts[present])
+            summary.loc[present, 'last_message'] = np.maximum.reduceat(sorted_dates, starts[present])
+
+        # Share of every chat's messages sent in each hour of the day
+        hours = preprocessor.date_feature(combined, 'hour').to_numpy().astype(np.int64)
+        by_hour = np.bincount(chat_codes * 24 + hours, minlength=n_chats * 24).reshape(n_chats, 24)
+        hourly = pd.DataFrame(by_hour / np.maximum(by_hour.sum(axis=1, keepdims=True), 1),
+                              index=pd.Index(chats, name='chat'), columns=pd.RangeIndex(24, name='hour'))
+
+        # Top words: (chat, token) counts over one token index of all chats
+        index = token_index(combined)
+        rows = index.rows(combined)
+        selected = rows[index.message_ids]
+        tokens = index.token_ids[selected]
+        token_chats = chat_codes[index.message_ids[selected]]
+        keep = ~(index.stop_mask[tokens] | (index.token_lengths[tokens] < 2))
+        keys, counts = np.unique(token_chats[keep] * len(index.vocab) + tokens[keep], return_counts=True)
+        key_chats, key_tokens = np.divmod(keys, max(len(index.vocab), 1))
+        order = np.lexsort((-counts, key_chats))
+        key_chats, key_tokens, counts = key_chats[order], key_tokens[order], counts[order]
+        rank = np.arange(len(key_chats)) - np.searchsorted(key_chats, key_chats)
+        top = rank < top_n
+        top_words = pd.DataFrame({
+            'chat': chats[key_chats[top]],
+            'rank': rank[top] + 1,
+            'word': index.vocab[key_tokens[top]],
+            'count': counts[top],
+        })
+
+    return summary, hourly, top_words
@@ -0,0 +1,126 @@
+import copy
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from framecache import per_frame
+from tokens import take_rows
+import perf
+
+
+# Keycap sequences (e.g. 1️⃣) start with a plain ASCII character
+KEYCAP_BASES = '0123456789#*'
+
+# Code points closer than this are scanned as one range
+RANGE_GAP = 64
+
+
+@lru_cache(maxsize=None)
+def emoji_trie():
+    """
+    Trie over every emoji sequence of the `emoji` package (ZWJ sequences, skin tones,
+    flags, keycaps) plus a regex for runs of characters that can be part of one.
+    """
+    import emoji
+
+    trie = {}
+    chars = set()
+    for sequence in emoji.EMOJI_DATA:
+        node = trie
+        for char in sequence:
+            node = node.setdefault(char, {})
+        node[''] = True
+        chars.update(sequence)
+
+    # Code points of the sequences, merged into a few ranges; the regex engine
+    # skips quickly to the next character inside them
+    points = sorted(ord(char) for char in chars - set(KEYCAP_BASES))
+    ranges = [[points[0], points[0]]]
+    for point in points[1:]:
+        if point - ranges[-1][1] <= RANGE_GAP:
+            ranges[-1][1] = point
+        else:
+            ranges.append([point, point])
+    char_class = ''.join(f'{re.escape(chr(low))}-{re.escape(chr(high))}' for low, high in ranges)
+    return trie, re.compile(f'[{char_class}]+')
+
+
+def iter_emojis(text):
+    """Yield (position, emoji) for every whole emoji sequence in `text`, longest match first"""
+    trie, runs = emoji_trie()
+
+    # Only the rare runs of emoji-capable characters are walked through the trie
+    for run in runs.finditer(text):
+        start, end = run.span()
+        if start > 0 and text[start - 1] in KEYCAP_BASES:
+            start -= 1
+        i = start
+        while i < end:
+            node = trie
+            match_end = None
+            j = i
+            while j < end and text[j] in node:
+                node = node[text[j]]
+                j += 1
+                if '' in node:
+                    match_end = j
+            if match_end is None:
+                i += 1
+            else:
+                yield i, text[i:match_end]
+                i = match_end
+
+
+class EmojiIndex:
+    """
+    Every emoji in a chat, found in a single scan of the concatenated messages.
+    `emoji_ids` index into `vocab`; `message_ids` give the row each emoji came from.
+    """
+
+    def __init__(self, df):
+        messages = df['message'].astype(str)
+        self.n_messages = len(messages)
+
+        # Emoji sequences never contain a newline, so matches can't cross messages
+        texts = messages.tolist()
+        starts = np.cumsum([0] + [len(text) + 1 for text in texts[:-1]]) if texts else np.zeros(0, dtype=np.int64)
+        found = list(iter_emojis('\n'.join(texts)))
+
+        positions = np.array([position for position, _ in found], dtype=np.int64)
+        self.message_ids = (np.searchsorted(starts, positions, side='right') - 1).astype(np.int64)
+        codes, vocab = pd.factorize(np.array([sequence for _, sequence in found], dtype=object))
+        self.emoji_ids = codes.astype(np.int64)
+        self.vocab = pd.Index(vocab, dtype=object)
+
+    def take(self, positions):
+        """EmojiIndex of the messages at sorted `positions`, sharing this index's vocabulary"""
+        items, message_ids = take_rows(self.message_ids, positions)
+        index = copy.copy(self)
+        index.n_messages = len(positions)
+        index.emoji_ids = self.emoji_ids[items]
+        index.message_ids = message_ids.astype(np.int64)
+        return index
+
+    def per_message(self):
+        """Number of emojis in each message"""
+        return np.bincount(self.message_ids, minlength=self.n_messages)
+
+    def most_common(self, rows):
+        """
+        (emoji, count) pairs of the selected messages, most used first; like
+        Counter.most_common, ties keep the order emojis first appear in.
+        """
+        selected = self.emoji_ids[rows[self.message_ids]]
+        if selected.size == 0:
+            return []
+
+        ids, first_seen, counts = np.unique(selected, return_index=True, return_counts=True)
+        order = np.lexsort((first_seen, -counts))
+        return list(zip(self.vocab[ids[order]], counts[order].tolist()))
+
+
+@per_frame
+def emoji_index(df):
+    """EmojiIndex for a preprocessed DataFrame, built once per frame"""
+    with perf.span('emoji index', len(df)):
+        return EmojiIndex(df)
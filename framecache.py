@@ -0,0 +1,125 @@
+import threading
+import weakref
+from collections import OrderedDict
+from functools import wraps
+
+_MISSING = object()
+
+
+class _BuildLocks:
+    """
+    One lock per key (e.g. per frame) held while its result is built, so a result is built
+    once while builds for other keys (other chats, other sessions) run alongside it.
+    """
+
+    def __init__(self):
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, key):
+        with self.lock:
+            lock = self.locks.setdefault(key, [threading.RLock(), 0])
+            lock[1] += 1
+        lock[0].acquire()
+        return lock
+
+    def release(self, key, lock):
+        lock[0].release()
+        with self.lock:
+            lock[1] -= 1
+            if not lock[1]:
+                del self.locks[key]
+
+
+def per_frame(builder):
+    """
+    Memoize `builder(df)` per DataFrame object, so structures derived from a chat
+    are built once and dropped together with the frame.
+    """
+    results = {}
+    # Only the dict is guarded by `lock`; builds hold their frame's lock alone, so
+    # lookups and the builds of other frames never wait on a slow build
+    lock = threading.Lock()
+    building = _BuildLocks()
+
+    def lookup(df):
+        with lock:
+            entry = results.get(id(df))
+            return entry[1] if entry is not None and entry[0]() is df else _MISSING
+
+    @wraps(builder)
+    def wrapper(df):
+        result = lookup(df)
+        if result is not _MISSING:
+            return result
+
+        frame_lock = building.acquire(id(df))
+        try:
+            # Another thread may have built it while this one waited
+            result = lookup(df)
+            if result is _MISSING:
+                result = builder(df)
+                seed(df, result)
+            return result
+        finally:
+            building.release(id(df), frame_lock)
+
+    def seed(df, result):
+        """Record an already computed result for `df`"""
+        with lock:
+            results[id(df)] = (weakref.ref(df), result)
+        weakref.finalize(df, results.pop, id(df), None)
+
+    def peek(df):
+        """The result already built for `df`, or None"""
+        result = lookup(df)
+        return None if result is _MISSING else result
+
+    wrapper.seed = seed
+    wrapper.peek = peek
+    return wrapper
+
+
+def per_frame_lru(maxsize):
+    """
+    Memoize `builder(df, key)` per DataFrame object, keeping the `maxsize` most
+    recently used keys (e.g. users) of each frame.
+    """
+    def decorate(builder):
+        # As in per_frame: `lock` guards the caches, each (frame, key) is built under its own lock
+        lock = threading.Lock()
+        building = _BuildLocks()
+
+        @per_frame
+        def entries(df):
+            return OrderedDict()
+
+        def lookup(cache, key):
+            with lock:
+                if key in cache:
+                    cache.move_to_end(key)
+                    return cache[key]
+                return _MISSING
+
+        @wraps(builder)
+        def wrapper(df, key):
+            cache = entries(df)
+            result = lookup(cache, key)
+            if result is not _MISSING:
+                return result
+
+            key_lock = building.acquire((id(df), key))
+            try:
+                result = lookup(cache, key)
+                if result is _MISSING:
+                    result = builder(df, key)
+                    with lock:
+                        cache[key] = result
+                        if len(cache) > maxsize:
+                            cache.popitem(last=False)
+                return result
+            finally:
+                building.release((id(df), key), key_lock)
+
+        return wrapper
+    return decorate
@@ -1,130 +1,73 @@
-import re
-import string
 import pandas as pd
-from collections import Counter
-from wordcloud import WordCloud
-from urlextract import URLExtract
-import matplotlib.pyplot as plt
 import numpy as np
-
-# Initialize URL extractor
-extract = URLExtract()
+import preprocessor
+import sentiment
+import ngrams
+import search
+from aggregates import chat_cube
+from emojis import emoji_index
+from replies import reply_index
+from timebuckets import time_buckets, bucket_counts, epoch_minutes
+from framecache import per_frame_lru
+from tokens import token_index
 
 def fetch_stats(selected_user, df):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-
-    # Fetch number of msgs
-    num_msgs = df.shape[0]
-    
-    # Fetch number of words
-    words = []
-    for msg in df['message']:
-        words.extend(msg.split())
+    cube = chat_cube(df)
 
-    # Fetch number of media messages
-    num_media_msgs = df[df['message'] == '<Media omitted>\n'].shape[0]
+    # Fetch number of msgs, words, media messages and links
+    num_msgs = cube.total('messages', selected_user)
+    num_words = cube.total('words', selected_user)
+    num_media_msgs = cube.total('media', selected_user)
+    num_links = cube.total('links', selected_user)
 
-    # Fetch number of links
-    links = []
-    for msg in df['message']:
-        try:
-            links.extend(extract.find_urls(msg))
-        except:
-            pass  # Handle potential errors with URL extraction
-
-    return num_msgs, len(words), num_media_msgs, len(links)
+    return num_msgs, num_words, num_media_msgs, num_links
     
 def most_busy_user(df):
-    # FIX: Ensure proper calculation of user message counts
-    user_counts = df['user'].value_counts()
+    user_counts = chat_cube(df).user_series()
     x = user_counts.head()
     
     # Calculate percentages
     df_percent = pd.DataFrame({
         'User': user_counts.index, 
-        'Percent of Messages': np.round((user_counts.values / df.shape[0]) * 100, 2)
+        'Percent of Messages': np.round((user_counts.values / user_counts.sum()) * 100, 2)
 
     })
     
     return x, df_percent
 
+# WordCloud draws at most this many words, so only the most frequent are passed to it
+WORDCLOUD_WORDS = 200
+
 def create_wordcloud(selected_user, df):
-    # Basic stopwords if file not found
-    stop_words = ["the", "and", "is", "in", "to", "of", "a", "for", "hai", "ki", "ko", "ka", "tha", 
-                "this", "that", "it", "me", "my", "you", "your", "na", "se", "ha", "was", "ho", "par"]
-    
-    try:
-        with open('stop_hinglish.txt', 'r') as f:
-            stop_words = f.read().splitlines()
-    except FileNotFoundError:
-        pass  # Use default stopwords
-        
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    # Word clouds of the most recently viewed users of each chat are kept
+    return _wordcloud(df, selected_user)
 
-    # Filter out group notifications and media messages
-    temp = df[df['user'] != 'group_notification']
-    temp = temp[temp['message'] != '<Media omitted>\n']
-    
-    def remove_stop_words(msg):
-        # Remove URLs and punctuation
-        msg = re.sub(r'http\S+', '', msg)
-        msg = re.sub(f"[{re.escape(string.punctuation)}]", "", msg)
-        
-        # Filter out stopwords
-        words = []
-        for word in msg.lower().split():
-            if word not in stop_words:
-                words.append(word)
-        return " ".join(words)
+@per_frame_lru(maxsize=8)
+def _wordcloud(df, selected_user):
+    index = token_index(df)
+    rows = index.rows(df, selected_user)
+
+    # Create a word cloud (wordcloud pulls in matplotlib, so it is only imported when needed)
+    from wordcloud import WordCloud
+    wc = WordCloud(width=500, height=500, min_font_size=10, background_color='black', max_words=WORDCLOUD_WORDS)
+
+    # Top word frequencies without URLs, punctuation and stopwords
+    frequencies = index.word_frequencies(rows, top_n=WORDCLOUD_WORDS)
 
-    # Create a word cloud
-    wc = WordCloud(width=500, height=500, min_font_size=10, background_color='black')
-    
-    # Clean and combine messages
-    temp['message'] = temp['message'].apply(remove_stop_words)
-    text = temp['message'].str.cat(sep=" ")
-    
     # Generate word cloud or empty one if no text
-    if text.strip():
-        df_wc = wc.generate(text)
+    if frequencies:
+        df_wc = wc.generate_from_frequencies(frequencies)
     else:
         df_wc = wc.generate("No text available")
     
     return df_wc
 
 def most_common_words(selected_user, df):
-    # Basic stopwords if file not found
-    stop_words = ["the", "and", "is", "in", "to", "of", "a", "for", "hai", "ki", "ko", "ka", "tha", 
-                "this", "that", "it", "me", "my", "you", "your", "na", "se", "ha", "was", "ho", "par"]
-    
-    try:
-        with open('stop_hinglish.txt', 'r') as f:
-            stop_words = f.read().splitlines()
-    except FileNotFoundError:
-        pass  # Use default stopwords
-
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    index = token_index(df)
+    rows = index.rows(df, selected_user)
 
-    # Filter out group notifications and media messages
-    temp = df[df['user'] != 'group_notification']
-    temp = temp[temp['message'] != '<Media omitted>\n']
-
-    words = []
-    for msg in temp['message']:
-        # Remove URLs and punctuation
-        msg = re.sub(r'http\S+', '', msg)
-        msg = re.sub(f"[{re.escape(string.punctuation)}]", "", msg)
-        
-        # Filter out stopwords and single characters
-        for word in msg.lower().split():
-            if word not in stop_words and len(word) > 1:
-                words.append(word)
-
-    # Return top 20 most common words
-    word_counts = Counter(words).most_common(20)
+    # Return top 20 most common words (no stopwords or single characters)
+    word_counts = index.most_common(rows, 20, min_length=2)
     if word_counts:
         return_df = pd.DataFrame(word_counts, columns=['Word', 'Count'])
     else:
@@ -133,34 +76,22 @@ def most_common_words(selected_user, df):
     
     return return_df
 
+def most_common_ngrams(selected_user, df, n=2, top_n=20, approximate=False):
+    # Top phrases of n words; the approximate mode counts with a fixed-size sketch
+    top = ngrams.top_grams(df, n, top_n, ngrams.APPROXIMATE if approximate else ngrams.EXACT)
+    top = top[top['user'] == selected_user]
+    return pd.DataFrame({'Phrase': top['gram'].to_numpy(), 'Count': top['count'].to_numpy()})
+
 def emoji_helper(selected_user, df):
-    # FIX: Use regex to extract emojis since we can't rely on emoji module
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    index = emoji_index(df)
+    if selected_user == 'Overall':
+        rows = np.ones(len(df), dtype=bool)
+    else:
+        rows = (df['user'] == selected_user).to_numpy()
 
-    # Simple emoji detection using regex pattern
-    # This won't catch all emojis but will work for basic ones
-    emoji_pattern = re.compile("["
-        u"\U0001F600-\U0001F64F"  # emoticons
-        u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-        u"\U0001F680-\U0001F6FF"  # transport & map symbols
-        u"\U0001F700-\U0001F77F"  # alchemical symbols
-        u"\U0001F780-\U0001F7FF"  # Geometric Shapes
-        u"\U0001F800-\U0001F8FF"  # Supplemental Arrows-C
-        u"\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
-        u"\U0001FA00-\U0001FA6F"  # Chess Symbols
-        u"\U0001FA70-\U0001FAFF"  # Symbols and Pictographs Extended-A
-        u"\U00002702-\U000027B0"  # Dingbats
-        u"\U000024C2-\U0001F251" 
-        "]+", flags=re.UNICODE)
-    
-    emojis = []
-    for message in df['message']:
-        found_emojis = emoji_pattern.findall(message)
-        emojis.extend(found_emojis)
-    
-    if emojis:
-        emoji_counts = Counter(emojis).most_common(len(Counter(emojis)))
+    # Whole emoji sequences (ZWJ, skin tones, flags), most used first
+    emoji_counts = index.most_common(rows)
+    if emoji_counts:
         emoji_df = pd.DataFrame(emoji_counts)
         return emoji_df
     else:
@@ -168,15 +99,8 @@ def emoji_helper(selected_user, df):
         return pd.DataFrame(columns=[0, 1])
 
 def monthly_timeline(selected_user, df):
-    # FIX: Ensure proper monthly timeline generation
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-
-    # Group by year and month
-    timeline = df.groupby(['year', 'month_num', 'month']).count()['message'].reset_index()
-    
-    # Sort chronologically
-    timeline = timeline.sort_values(['year', 'month_num'])
+    # Months in chronological order
+    timeline = chat_cube(df).month_frame(selected_user)
     
     # Create a time column for display
     timeline['time'] = timeline['month'] + '-' + timeline['year'].astype(str)
@@ -184,113 +108,120 @@ def monthly_timeline(selected_user, df):
     return timeline
 
 def hourly_activity(selected_user, df):
-    # FIX: Create hourly activity analysis
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-    
-    # Create a count of messages by hour
-    hourly = df.groupby('hour').count()['message'].reset_index()
-    
-    # Ensure all hours are represented (0-23)
-    all_hours = pd.DataFrame({'hour': range(0, 24)})
-    hourly = pd.merge(all_hours, hourly, on='hour', how='left').fillna(0)
+    # Count of messages for every hour (0-23)
+    hourly = chat_cube(df).hour_series(selected_user).rename('message').reset_index()
     
     return hourly
 
 def week_activity_map(selected_user, df):
-    # FIX: Create weekly activity map
+    # Count of messages for every day, Monday first
+    return chat_cube(df).weekday_series(selected_user)
+
+def activity_heatmap(selected_user, df):
+    # Messages per weekday (Monday first) and hour of the day
+    return time_buckets(df).heatmap(selected_user)
+
+def activity_timeline(selected_user, df, resolution='day', window=None):
+    # Messages per minute, hour, day, week or month; averaged over the last `window` bins if given
+    buckets = time_buckets(df)
+    if window:
+        return buckets.rolling(window, resolution, selected_user, how='mean')
+    return buckets.counts(resolution, selected_user)
+
+def _search_rows(query, selected_user, df):
+    rows = search.search_index(df).search(query)
     if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+        rows = rows[(df['user'].iloc[rows] == selected_user).to_numpy()]
+    return rows
+
+def search_messages(query, selected_user, df, limit=200):
+    # Messages containing a word or phrase: (number found, the latest `limit` with a snippet around the match)
+    rows = _search_rows(query, selected_user, df)
+    found = df.iloc[rows[::-1][:limit]]
+    results = pd.DataFrame({
+        'date': found['date'].to_numpy(),
+        'user': found['user'].astype(str).to_numpy(),
+        'message': [search.snippet(message, query) for message in found['message']],
+    })
+    return len(rows), results
 
-    # Define day order
-    day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    
-    # Count messages by day
-    day_counts = df['day_name'].value_counts()
-    
-    # Ensure all days are represented
-    day_counts = day_counts.reindex(day_order, fill_value=0)
-    
-    return day_counts
+def search_timeline(query, selected_user, df, resolution='month'):
+    # Messages containing a word or phrase per minute, hour, day, week or month
+    rows = _search_rows(query, selected_user, df)
+    return bucket_counts(epoch_minutes(df['date'].iloc[rows]), resolution)
 
-def sentiment_analysis(df, selected_user='Overall'):
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-    
-    df = df[df['user'] != 'group_notification']
-    df = df[df['message'] != '<Media omitted>\n']
+def sentiment_analysis(df, selected_user='Overall', lexicon=None):
+    index = token_index(df)
+    rows = index.rows(df, selected_user)
+    # Lexicon score of every message, summed over its tokens in one pass
+    scores = sentiment.message_scores(df, lexicon)[rows]
+    df = df[rows]
     
     if df.empty:
         return {'Positive': 0, 'Negative': 0, 'Neutral': 0}, df
     
     df = df.copy()
     
-    positive_words = ['happy', 'love', 'great', 'good', 'nice', 'thanks', 'awesome', 'amazing', 'excellent', 'wonderful', 'joy']
-    negative_words = ['sad', 'bad', 'hate', 'terrible', 'awful', 'sorry', 'angry', 'upset', 'disappointed', 'problem', 'fail']
-    
-    def basic_sentiment(text):
-        text = text.lower()
-        words = text.split()
-        pos_count = sum(1 for word in words if word in positive_words)
-        neg_count = sum(1 for word in words if word in negative_words)
-        
-        if pos_count > neg_count:
-            return 0.5, 'Positive'
-        elif neg_count > pos_count:
-            return -0.5, 'Negative'
-        else:
-            return 0, 'Neutral'
-    
-    sentiments = []
-    labels = []
-    
-    for msg in df['message']:
-        score, label = basic_sentiment(msg)
-        sentiments.append(score)
-        labels.append(label)
-    
-    df['sentiment'] = sentiments
-    df['sentiment_label'] = labels
+    df['sentiment'] = sentiment.normalize(scores)
+    df['sentiment_label'] = sentiment.labels(scores)
     
     sentiment_counts = df['sentiment_label'].value_counts().to_dict()
     
     # Ensure all categories are included
-    for label in ['Positive', 'Negative', 'Neutral']:
+    for label in sentiment.LABELS:
         sentiment_counts.setdefault(label, 0)
     
     return sentiment_counts, df
 
-
-def response_time_analysis(df, selected_user='Overall'):
-    # FIX: Calculate response times between users
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-
-    # Skip group notifications
-    df = df[df['user'] != 'group_notification']
+def sentiment_trend(selected_user, df, lexicon=None):
+    index = token_index(df)
+    rows = index.rows(df, selected_user)
+    scores = sentiment.normalize(sentiment.message_scores(df, lexicon)[rows])
+    
+    # Mean sentiment of every month, in chronological order
+    year = preprocessor.date_feature(df, 'year').to_numpy()[rows].astype(np.int64)
+    month_num = preprocessor.date_feature(df, 'month_num').to_numpy()[rows].astype(np.int64)
+    months, inverse = np.unique(year * 12 + month_num - 1, return_inverse=True)
+    totals = np.bincount(inverse, weights=scores, minlength=len(months))
+    counts = np.bincount(inverse, minlength=len(months))
+    
+    trend = pd.DataFrame({
+        'year': months // 12,
+        'month_num': months % 12 + 1,
+        'sentiment': totals / np.maximum(counts, 1),
+    })
+    trend['month_year'] = trend['month_num'].astype(str) + '-' + trend['year'].astype(str)
     
-    # Sort by date
-    df = df.sort_values('date')
+    return trend
 
-    # Calculate time difference between messages
-    df['time_diff'] = df['date'].diff()
-    
-    # Add next user column
-    df['next_user'] = df['user'].shift(-1)
-    
-    # Filter for actual responses (different users)
-    df_responses = df[df['user'] != df['next_user']].copy()
-    
-    # Convert time difference to minutes
-    df_responses['response_mins'] = df_responses['time_diff'].dt.total_seconds() / 60
-    
-    # Filter out unreasonably long times (>24 hours)
-    df_responses = df_responses[df_responses['response_mins'] < 24*60]
+
+def response_time_analysis(df, selected_user='Overall'):
+    # Replies written by the user to whoever spoke before them, found on the full timeline
+    index = reply_index(df)
+    response_df = index.reply_frame(selected_user)
     
-    if len(df_responses) > 0:
-        avg_response_time = df_responses['response_mins'].mean()
-        response_df = df_responses[['user', 'next_user', 'response_mins']].copy()
+    if len(response_df) > 0:
+        avg_response_time = response_df['response_mins'].mean()
         return np.round(avg_response_time, 2), response_df
     else:
         # Return defaults if no valid responses
-        return 0, pd.DataFrame(columns=['user', 'next_user', 'response_mins'])
\ No newline at end of file
+        return 0, pd.DataFrame(columns=['user', 'replied_to', 'response_mins'])
+
+def response_percentiles(selected_user, df):
+    # p50 / p90 / p99 reply latency in minutes
+    return reply_index(df).percentiles(selected_user)
+
+def reply_matrix(df, top_n=15):
+    # Median minutes each user takes to reply to each other user, for the users who reply most
+    index = reply_index(df)
+    matrix = index.matrix()
+    top = index.summary()['user'].head(top_n)
+    return matrix.loc[top, top]
+
+def reply_summary(df):
+    # Replies and latency percentiles of every user
+    return reply_index(df).summary()
+
+def conversation_sessions(selected_user, df):
+    # Bursts of conversation separated by long silences
+    return reply_index(df).sessions(selected_user)
@@ -0,0 +1,134 @@
+"""
+Background jobs for the app: a bounded thread pool shared by every session, with progress
+reporting, partial results, deduplication of identical jobs and cooperative cancellation.
+"""
+import contextvars
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import perf
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once it has been cancelled"""
+
+
+class Job:
+    """
+    One background computation. The running function reports progress and publishes
+    partial results through it; `report` is also where a cancelled job stops.
+    The perf spans of the job are kept in its own `recorder`.
+    """
+
+    def __init__(self, key, group=None):
+        self.key = key
+        self.group = group
+        self.progress = 0.0
+        self.message = "Queued"
+        self.partial = {}
+        self.owners = set()
+        self.future = None
+        self.recorder = perf.Recorder()
+        self._cancelled = threading.Event()
+
+    def report(self, progress, message=None):
+        """Record progress (0-1) from inside the job; raises JobCancelled once the job is cancelled"""
+        self.check()
+        self.progress = min(max(float(progress), 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+    def publish(self, name, value):
+        """Make a partial result available before the job finishes"""
+        self.partial[name] = value
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise JobCancelled(self.key)
+
+    def cancel(self):
+        """Stop the job at its next progress report (or before it starts, if it is still queued)"""
+        self._cancelled.set()
+        self.future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def failed(self):
+        """Finished with an error (other than being cancelled)"""
+        return (self.done() and not self.cancelled and not self.future.cancelled()
+                and self.future.exception() is not None)
+
+    @property
+    def error(self):
+        return self.future.exception() if self.failed else None
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class JobRunner:
+    """
+    Runs `func(job, *args)` on a bounded pool. Jobs are keyed (e.g. by content hash): submitting
+    a key that is running or finished returns the existing job, so identical work runs once.
+    The most recent `keep` finished jobs of each group (e.g. parsing, analysis) are kept with
+    their results (or errors), so one kind of job never evicts the results of another.
+    """
+
+    def __init__(self, max_workers=2, keep=16):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.jobs = OrderedDict()
+        self.keep = keep
+        self.lock = threading.Lock()
+
+    def submit(self, key, func, *args, owner=None, group=None):
+        """The job for `key`, started with func(job, *args) unless it already exists; `owner` follows it"""
+        with self.lock:
+            job = self.jobs.get(key)
+            # Cancelled jobs are started again; failed ones keep their error rather than
+            # failing again on every poll, until they are forgotten (see `forget`)
+            if job is None or job.cancelled:
+                job = Job(key, group)
+                # Pool threads don't inherit context variables; each job runs in a fresh context
+                # (not the submitting session's) that records into the job's own Recorder
+                job.future = self.executor.submit(contextvars.Context().run, self._run, job, func, args)
+                self.jobs[key] = job
+            self.jobs.move_to_end(key)
+            if owner is not None:
+                job.owners.add(owner)
+            self._trim()
+            return job
+
+    @staticmethod
+    def _run(job, func, args):
+        with perf.recording(job.recorder):
+            job.report(0.0, "Running")
+            return func(job, *args)
+
+    def release(self, job, owner):
+        """Stop following a job; an unfinished job nobody follows any more is cancelled"""
+        with self.lock:
+            job.owners.discard(owner)
+            if not job.owners and not job.done():
+                job.cancel()
+
+    def forget(self, key):
+        """Drop a finished job (e.g. a failed one) so the next submit of its key runs it again"""
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None and job.done():
+                del self.jobs[key]
+
+    def _trim(self):
+        finished = {}
+        for key, job in self.jobs.items():
+            if job.done():
+                finished.setdefault(job.group, []).append(key)
+        for keys in finished.values():
+            for key in keys[:max(0, len(keys) - self.keep)]:
+                del self.jobs[key]
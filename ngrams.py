@@ -0,0 +1,175 @@
+"""
+Top-k words and n-grams of every user and of the whole chat in one pass over the token index.
+
+Two modes:
+- exact: every distinct (user, n-gram) is counted; memory grows with the distinct n-grams.
+- approximate: a Count-Min sketch counts the stream and only the current top `k` candidates
+  of every user are kept, so memory is bounded by the sketch size and `k` whatever the chat.
+  Counts are estimates that can only overshoot, by at most ~e / 2 ** SKETCH_BITS of the
+  n-grams seen (far less in practice, thanks to conservative updates).
+"""
+import numpy as np
+import pandas as pd
+from framecache import per_frame_lru
+from tokens import token_index
+from columns import user_codes
+import perf
+
+EXACT, APPROXIMATE = 'exact', 'approximate'
+
+OVERALL = 'Overall'
+
+# Count-Min sketch size: SKETCH_DEPTH rows of 2 ** SKETCH_BITS counters
+SKETCH_BITS = 18
+SKETCH_DEPTH = 4
+
+# Tokens streamed through the sketch at a time
+CHUNK_TOKENS = 1 << 20
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_FNV_PRIME = np.uint64(0x100000001B3)
+
+
+def _mix(keys):
+    """splitmix64 finalizer: spreads the bits of uint64 keys"""
+    keys = (keys ^ (keys >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    keys = (keys ^ (keys >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return keys ^ (keys >> np.uint64(31))
+
+
+class CountMinSketch:
+    """Count-Min sketch over uint64 keys, updated and queried a numpy array at a time"""
+
+    def __init__(self, bits=SKETCH_BITS, depth=SKETCH_DEPTH):
+        self.shift = np.uint64(64 - bits)
+        self.seeds = _mix(np.arange(1, depth + 1, dtype=np.uint64) * _GOLDEN)
+        self.table = np.zeros((depth, 1 << bits), dtype=np.int64)
+
+    def _slots(self, keys):
+        return [(_mix(keys ^ seed) >> self.shift).astype(np.intp) for seed in self.seeds]
+
+    def add(self, keys):
+        """
+        Count `keys` with conservative update: a key's counters are only raised to its new
+        estimate, which keeps collisions from inflating the other keys sharing them
+        """
+        keys, counts = np.unique(keys, return_counts=True)
+        slots = self._slots(keys)
+        estimates = np.min([row[where] for row, where in zip(self.table, slots)], axis=0) + counts
+        for row, where in zip(self.table, slots):
+            np.maximum.at(row, where, estimates)
+
+    def estimate(self, keys):
+        """Upper bounds of the counts of `keys`"""
+        return np.min([row[slots] for row, slots in zip(self.table, self._slots(keys))], axis=0)
+
+
+def _grams(index, rows, n, min_length, start=0, stop=None):
+    """
+    Token positions in [start, stop) where a kept n-gram begins: all n tokens are in the same
+    selected message and not all of them are stopwords or shorter than `min_length`.
+    """
+    stop = len(index.token_ids) - n + 1 if stop is None else min(stop, len(index.token_ids) - n + 1)
+    if stop <= start:
+        return np.zeros(0, dtype=np.int64)
+    positions = np.arange(start, stop)
+    message_ids = index.message_ids
+    keep = rows[message_ids[positions]] & (message_ids[positions + n - 1] == message_ids[positions])
+
+    junk = index.stop_mask | (index.token_lengths < min_length)
+    all_junk = np.ones(len(positions), dtype=bool)
+    for offset in range(n):
+        all_junk &= junk[index.token_ids[positions + offset]]
+    return positions[keep & ~all_junk]
+
+
+def _top_per_group(groups, counts, tiebreak, k):
+    """Positions of the top `k` items of every group, by count then `tiebreak`, grouped and ranked"""
+    order = np.lexsort((tiebreak, -counts, groups))
+    groups = groups[order]
+    rank = np.arange(len(order)) - np.searchsorted(groups, groups)
+    return order[rank < k], rank[rank < k] + 1
+
+
+def _exact(index, rows, user_codes, n_users, n, k, min_length):
+    positions = _grams(index, rows, n, min_length)
+
+    # Dense n-gram ids, one token at a time, so keys never outgrow int64
+    gram_ids = index.token_ids[positions].astype(np.int64)
+    for offset in range(1, n):
+        keys = gram_ids * len(index.vocab) + index.token_ids[positions + offset]
+        _, gram_ids = np.unique(keys, return_inverse=True)
+    n_grams = int(gram_ids.max()) + 1 if gram_ids.size else 1
+
+    # Every occurrence counts for its user and for the chat overall (group n_users)
+    users = np.concatenate([user_codes[index.message_ids[positions]], np.full(len(positions), n_users)])
+    keys, first, counts = np.unique(users * n_grams + np.tile(gram_ids, 2), return_index=True, return_counts=True)
+    top, rank = _top_per_group(keys // n_grams, counts, first, k)
+    return keys[top] // n_grams, np.tile(positions, 2)[first[top]], counts[top], rank
+
+
+def _approximate(index, rows, user_codes, n_users, n, k, min_length):
+    sketch = CountMinSketch()
+    # Current candidates: their (user, n-gram) key, group and first token position
+    cand_keys = np.zeros(0, dtype=np.uint64)
+    cand_groups = np.zeros(0, dtype=np.int64)
+    cand_positions = np.zeros(0, dtype=np.int64)
+
+    for start in range(0, len(index.token_ids), CHUNK_TOKENS):
+        positions = _grams(index, rows, n, min_length, start, start + CHUNK_TOKENS)
+        if positions.size == 0:
+            continue
+
+        # FNV-style hash of the n token ids, then keyed by user and by overall
+        hashes = np.zeros(len(positions), dtype=np.uint64)
+        for offset in range(n):
+            hashes = (hashes ^ index.token_ids[positions + offset].astype(np.uint64)) * _FNV_PRIME
+        groups = np.concatenate([user_codes[index.message_ids[positions]], np.full(len(positions), n_users)])
+        keys = _mix(np.tile(hashes, 2) ^ _mix(groups.astype(np.uint64) + np.uint64(1)))
+        sketch.add(keys)
+
+        # Merge this chunk's distinct n-grams into the candidates and keep the top k of each group
+        keys, first = np.unique(np.concatenate([cand_keys, keys]), return_index=True)
+        groups = np.concatenate([cand_groups, groups])[first]
+        positions = np.concatenate([cand_positions, np.tile(positions, 2)])[first]
+        estimates = sketch.estimate(keys)
+        top, _ = _top_per_group(groups, estimates, positions, k)
+        cand_keys, cand_groups, cand_positions = keys[top], groups[top], positions[top]
+
+    counts = sketch.estimate(cand_keys)
+    top, rank = _top_per_group(cand_groups, counts, cand_positions, k)
+    return cand_groups[top], cand_positions[top], counts[top], rank
+
+
+def top_grams(df, n=1, k=20, mode=EXACT, min_length=2):
+    """
+    The `k` most frequent n-grams of every user and of the whole chat (user 'Overall'),
+    as a frame of user, rank, gram and count. Ties go to the n-gram seen first.
+    N-grams made only of stopwords or words shorter than `min_length` are skipped.
+    """
+    if mode not in (EXACT, APPROXIMATE):
+        raise ValueError(f"Unknown mode {mode!r}, expected {EXACT!r} or {APPROXIMATE!r}")
+    return _top_grams(df, (n, k, mode, min_length))
+
+
+@per_frame_lru(maxsize=8)
+def _top_grams(df, key):
+    n, k, mode, min_length = key
+    index = token_index(df)
+    rows = index.rows(df)
+    codes, users = user_codes(df)
+
+    with perf.span(f'top {n}-grams ({mode})', len(df)):
+        count = _exact if mode == EXACT else _approximate
+        groups, positions, counts, rank = count(index, rows, codes, len(users), n, k, min_length)
+
+        words = [index.vocab[index.token_ids[positions + offset]] for offset in range(n)]
+        grams = words[0].to_numpy(dtype=object)
+        for more in words[1:]:
+            grams = grams + ' ' + more.to_numpy(dtype=object)
+        return pd.DataFrame({
+            'user': users.append(pd.Index([OVERALL]))[groups],
+            'rank': rank,
+            'gram': grams,
+            'count': counts,
+        })
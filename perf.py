@@ -0,0 +1,90 @@
+import contextvars
+import json
+import logging
+import time
+from contextlib import contextmanager
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger('chat_analyzer.perf')
+
+_recorder = contextvars.ContextVar('perf_recorder', default=None)
+_depth = contextvars.ContextVar('perf_depth', default=0)
+
+
+def peak_rss_mb():
+    """High-water mark of the process' resident memory in MB (None where unsupported)"""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Recorder:
+    """Collects the spans recorded while it is active (see `recording`)"""
+
+    def __init__(self):
+        self.spans = []
+
+    def merged(self, others):
+        """A Recorder with these spans followed by those of `others` ({name: Recorder}), their stages prefixed by name"""
+        merged = Recorder()
+        merged.spans = self.spans + [dict(record, stage=f"{name}: {record['stage']}")
+                                     for name, other in others.items() for record in other.spans]
+        return merged
+
+    def to_frame(self):
+        columns = ['stage', 'seconds', 'rows', 'peak_rss_mb', 'peak_growth_mb', 'depth']
+        return pd.DataFrame(self.spans, columns=columns)
+
+    def to_json_lines(self):
+        return ''.join(json.dumps(span) + '\n' for span in self.spans)
+
+
+@contextmanager
+def recording(recorder=None):
+    """Record every span opened in this context (e.g. one Streamlit rerun) into `recorder`"""
+    recorder = recorder or Recorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+def start_recording():
+    """Start a fresh Recorder for the rest of the current context (e.g. a Streamlit script run)"""
+    recorder = Recorder()
+    _recorder.set(recorder)
+    return recorder
+
+
+@contextmanager
+def span(stage, rows=None):
+    """
+    Time a pipeline stage and note its peak memory. Yields a dict; set its 'rows'
+    to record how many rows the stage processed. Always logged to the
+    'chat_analyzer.perf' logger, and kept by the active Recorder if there is one.
+    """
+    record = {'stage': stage, 'rows': rows, 'depth': _depth.get()}
+    recorder = _recorder.get()
+    if recorder is not None:
+        # Kept in the order stages start, so nested stages follow their parent
+        recorder.spans.append(record)
+    depth_token = _depth.set(record['depth'] + 1)
+    peak_before = peak_rss_mb()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = round(time.perf_counter() - start, 4)
+        _depth.reset(depth_token)
+        peak_after = peak_rss_mb()
+        if peak_after is not None:
+            record['peak_rss_mb'] = round(peak_after, 1)
+            record['peak_growth_mb'] = round(peak_after - peak_before, 1)
+        logger.info(json.dumps(record))
@@ -1,115 +1,543 @@
 import pandas as pd
+import numpy as np
+import io
+import mmap
+import multiprocessing
+import os
 import re
-import datetime
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import repeat
+from pandas.api.types import union_categoricals
 
-def preprocess(data):
+# Columns stored by preprocess(compact=True)
+COMPACT_COLUMNS = ['date', 'user', 'message']
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Number of messages parsed before a batch of columns is handed back
+BATCH_SIZE = 50_000
+
+# Number of timestamps sniff_date_format inspects at a time
+SNIFF_BLOCK_SIZE = 1000
+
+# One compiled pass over each line finds the timestamp and the sender.
+# Supports DD/MM/YY, 12-hour (e.g. 01/02/21, 3:04 pm - ) and 24-hour (e.g. 01/02/21, 15:04 - )
+# exports; the sender is everything up to the first ": " on the header line.
+LINE_PATTERN = re.compile(
+    r'(\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}(?:(?:\u202f|\s)?[ap]m)?)\s-\s'
+    r'(?:(.*?):\s)?'
+)
+
+UTF8_BOM = b'\xef\xbb\xbf'
+UTF16_BOMS = (b'\xff\xfe', b'\xfe\xff')
+
+# LINE_PATTERN for the raw bytes of a UTF-8 export, anchored at line starts so message
+# boundaries are found without decoding the export. It accepts exactly what LINE_PATTERN
+# accepts on the lines of the decoded export (read with universal newlines): _BLANK is the
+# UTF-8 of every character \s matches but \r and \n, and a header line may end right after
+# its "-" or sender ":" (e.g. "Alice:" followed by the message on the next line).
+# The first line may start with a byte order mark, which is part of its match.
+_BLANK = (rb'(?:[\t\x0b\x0c\x1c-\x1f ]|\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]'
+          rb'|\xe2\x81\x9f|\xe3\x80\x80)')
+_NEWLINE = rb'(?:\r\n|\r|\n)'
+_HEADER = (rb'(\d{1,2}/\d{1,2}/\d{2,4},' + _BLANK + rb'\d{1,2}:\d{2}(?:' + _BLANK + rb'?[ap]m)?)' + _BLANK + rb'-'
+           + rb'(?:' + _NEWLINE + rb'|' + _BLANK + rb'(?:([^\r\n]*?):(?:' + _BLANK + rb'|' + _NEWLINE + rb'))?)')
+BYTES_LINE_PATTERN = re.compile(rb'^(?:\A' + UTF8_BOM + rb')?' + _HEADER, re.MULTILINE)
+# Same, for exports with old Mac (lone \r) line breaks; slower, so only used when there are any
+BYTES_CR_LINE_PATTERN = re.compile(rb'(?:^(?:\A' + UTF8_BOM + rb')?|(?<=\r))' + _HEADER, re.MULTILINE)
+CARRIAGE_RETURN = re.compile(rb'\r')
+LONE_CARRIAGE_RETURN = re.compile(rb'\r(?!\n)')
+
+# The same patterns for decoded chat text, so it is scanned in place as well
+_TEXT_BLANK = r'[^\S\r\n]'
+_TEXT_NEWLINE = r'(?:\r\n|\r|\n)'
+_TEXT_HEADER = (r'(\d{1,2}/\d{1,2}/\d{2,4},' + _TEXT_BLANK + r'\d{1,2}:\d{2}(?:' + _TEXT_BLANK + r'?[ap]m)?)'
+                + _TEXT_BLANK + r'-(?:' + _TEXT_NEWLINE + r'|' + _TEXT_BLANK
+                + r'(?:([^\r\n]*?):(?:' + _TEXT_BLANK + r'|' + _TEXT_NEWLINE + r'))?)')
+TEXT_LINE_PATTERN = re.compile(r'^(?:\A\ufeff)?' + _TEXT_HEADER, re.MULTILINE)
+TEXT_CR_LINE_PATTERN = re.compile(r'(?:^(?:\A\ufeff)?|(?<=\r))' + _TEXT_HEADER, re.MULTILINE)
+TEXT_CARRIAGE_RETURN = re.compile(r'\r')
+TEXT_LONE_CARRIAGE_RETURN = re.compile(r'\r(?!\n)')
+
+WHITESPACE = re.compile(r'\s')
+
+# Messages that aren't valid UTF-8 (e.g. pasted from an older export) are decoded with this
+FALLBACK_ENCODING = 'cp1252'
+
+# Day/month fields and year of a cleaned timestamp
+STAMP_PATTERN = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{2,4}),')
+
+
+def iter_message_batches(lines, batch_size=BATCH_SIZE):
+    """
+    Stream over the lines of a WhatsApp export and yield column batches
+    ({'message_date': [...], 'user': [...], 'message': [...]}).
+    Lines that don't start with a timestamp are continuations of the previous message.
+    """
+    dates, users, messages = [], [], []
+    current = None  # [message_date, user, list of message lines]
+
+    def flush(record):
+        dates.append(record[0])
+        users.append(record[1])
+        text = ''.join(record[2])
+        # System or group notification (no sender)
+        messages.append(text if record[1] != 'group_notification' else text.strip())
+
+    for line in lines:
+        match = LINE_PATTERN.match(line)
+        if match is None:
+            # Multi-line message (text before the first timestamp is ignored)
+            if current is not None:
+                current[2].append(line)
+            continue
+
+        if current is not None:
+            flush(current)
+            if len(dates) >= batch_size:
+                yield {'message_date': dates, 'user': users, 'message': messages}
+                dates, users, messages = [], [], []
+
+        # Clean dates (remove Unicode spaces)
+        message_date = _clean_stamp(match.group(1))
+        sender = match.group(2)
+        if sender is None:
+            current = [message_date, 'group_notification', [line[match.end():]]]
+        else:
+            current = [message_date, sender, [line[match.end():]]]
+
+    if current is not None:
+        flush(current)
+    if dates:
+        yield {'message_date': dates, 'user': users, 'message': messages}
+
+
+def _decode(raw):
+    if isinstance(raw, str):
+        return raw
+    try:
+        return str(raw, 'utf-8')
+    except UnicodeDecodeError:
+        return str(raw, FALLBACK_ENCODING, errors='replace')
+
+
+def _clean_stamp(stamp):
+    return WHITESPACE.sub(' ', stamp)
+
+
+def _line_pattern(data, start=0, end=None):
+    """The message header pattern for the text or bytes of an export between `start` and `end`"""
+    end = len(data) if end is None else end
+    if isinstance(data, str):
+        return TEXT_CR_LINE_PATTERN if TEXT_LONE_CARRIAGE_RETURN.search(data, start, end) else TEXT_LINE_PATTERN
+    return BYTES_CR_LINE_PATTERN if LONE_CARRIAGE_RETURN.search(data, start, end) else BYTES_LINE_PATTERN
+
+
+def iter_buffer_batches(data, batch_size=BATCH_SIZE, start=0, end=None, progress=None):
+    """
+    iter_message_batches over the raw bytes of an export (bytes, memoryview or mmap), or its
+    decoded text, between `start` and `end`. Message boundaries are found in place; only the
+    timestamp, sender and text of each message are decoded, so the export is never decoded or
+    copied whole.
+    `progress`, if given, is called with the fraction of the bytes scanned after every batch.
+    """
+    end = len(data) if end is None else end
+    # Universal newlines, as when the export is read in text mode
+    carriage_return = TEXT_CARRIAGE_RETURN if isinstance(data, str) else CARRIAGE_RETURN
+    crlf = carriage_return.search(data, start, end) is not None
+    dates, users, messages = [], [], []
+
+    def flush(match, stop):
+        dates.append(_clean_stamp(_decode(match.group(1))))
+        text = _decode(data[match.end():stop])
+        if crlf:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        if match.group(2) is None:
+            # System or group notification (no sender)
+            users.append('group_notification')
+            messages.append(text.strip())
+        else:
+            users.append(_decode(match.group(2)))
+            messages.append(text)
+
+    # Each message runs from the end of its header to the start of the next one
+    # (text before the first timestamp is ignored)
+    previous = None
+    for match in _line_pattern(data, start, end).finditer(data, start, end):
+        if previous is not None:
+            flush(previous, match.start())
+            if len(dates) >= batch_size:
+                if progress is not None:
+                    progress((match.start() - start) / max(end - start, 1))
+                yield {'message_date': dates, 'user': users, 'message': messages}
+                dates, users, messages = [], [], []
+        previous = match
+
+    if previous is not None:
+        flush(previous, end)
+    if dates:
+        yield {'message_date': dates, 'user': users, 'message': messages}
+
+
+def sniff_date_format(stamps):
+    """
+    Work out the timestamp layout of an export from its (cleaned) timestamps.
+    Returns the 12-hour and 24-hour formats sharing the detected day/month order and year width.
+    """
+    stamps = pd.Series(stamps, dtype=object)
+    day_first = month_first = four_digit_year = False
+    # Every timestamp counts, but a day or month past the 12th settles the order, which
+    # usually happens within the first weeks of a chat
+    for start in range(0, len(stamps), SNIFF_BLOCK_SIZE):
+        fields = stamps[start:start + SNIFF_BLOCK_SIZE].str.extract(STAMP_PATTERN.pattern)
+        day_first |= bool((pd.to_numeric(fields[0]) > 12).any())
+        month_first |= bool((pd.to_numeric(fields[1]) > 12).any())
+        four_digit_year |= bool((fields[2].str.len() == 4).any())
+        if day_first or month_first:
+            break
+
+    # Day first unless the timestamps prove otherwise (the common WhatsApp layout)
+    date_part = '%m/%d' if month_first and not day_first else '%d/%m'
+    date_part += '/%Y' if four_digit_year else '/%y'
+
+    return {'12h': date_part + ', %I:%M %p', '24h': date_part + ', %H:%M',
+            'dayfirst': date_part.startswith('%d')}
+
+
+def _parse_dates(message_date, formats):
+    """Convert a Series of cleaned timestamp strings to datetimes in one vectorized pass"""
+    # Thousands of messages share the same minute, so only distinct timestamps are parsed
+    codes, uniques = pd.factorize(message_date)
+    uniques = pd.Series(uniques).str.replace(r'(\d)([ap]m)$', r'\1 \2', regex=True)
+
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[ns]')
+    twelve_hour = uniques.str.endswith('m')
+    if twelve_hour.any():
+        parsed[twelve_hour] = pd.to_datetime(uniques[twelve_hour], format=formats['12h'], errors='coerce')
+    if not twelve_hour.all():
+        parsed[~twelve_hour] = pd.to_datetime(uniques[~twelve_hour], format=formats['24h'], errors='coerce')
+
+    # Fallback to a more flexible parser for anything the sniffed layout missed
+    missing = parsed.isna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(uniques[missing], format='mixed',
+                                         dayfirst=formats['dayfirst'], errors='coerce')
+
+    return pd.Series(parsed.to_numpy()[codes], index=message_date.index)
+
+
+def _month_name(date):
+    return pd.Categorical.from_codes(date.dt.month - 1, categories=MONTHS, ordered=True)
+
+
+def _day_name(date):
+    return pd.Categorical.from_codes(date.dt.dayofweek, categories=DAYS, ordered=True)
+
+
+# Date features derived from the `date` column, in their compact dtypes
+DATE_FEATURES = {
+    'year': lambda date: date.dt.year.astype('int16'),
+    'month_num': lambda date: date.dt.month.astype('int8'),
+    'month': _month_name,
+    'day': lambda date: date.dt.day.astype('int8'),
+    'day_name': _day_name,
+    'hour': lambda date: date.dt.hour.astype('int8'),
+    'minute': lambda date: date.dt.minute.astype('int8'),
+}
+
+
+def date_feature(df, name):
+    """
+    Return a date feature column ('year', 'hour', 'day_name', ...) of a preprocessed DataFrame.
+    Compact frames don't store these, so they are derived from `date` only when asked for.
+    """
+    if name in df.columns:
+        return df[name]
+    return pd.Series(DATE_FEATURES[name](df['date']), index=df.index, name=name)
+
+
+def _collect(batches):
+    """
+    Column batches as frames of user and message, with every message's timestamp as a code
+    into the distinct timestamps of its batch: [(frame, codes, stamps), ...]. Dates are only
+    parsed once the whole chat is collected (see _date_frames), so all of it is read in one layout.
+    """
+    collected = []
+    for batch in batches:
+        codes, stamps = pd.factorize(np.array(batch['message_date'], dtype=object))
+        frame = pd.DataFrame({'user': np.array(batch['user'], dtype=object),
+                              'message': np.array(batch['message'], dtype=object)})
+        collected.append((frame, codes, stamps))
+    return collected
+
+
+def _date_frames(collected, compact=False, formats=None):
+    """
+    Add the dates (and date features) to collected batches. Unless `formats` is given, the layout
+    is sniffed over the distinct timestamps of all of them. Returns (frames, formats).
+    """
+    inverse, stamps = pd.factorize(np.concatenate([stamps for _, _, stamps in collected]))
+    if formats is None:
+        formats = sniff_date_format(stamps)
+    dates = _parse_dates(pd.Series(stamps, dtype=object), formats).to_numpy()
+
+    frames, offset = [], 0
+    for frame, codes, batch_stamps in collected:
+        frame.insert(0, 'date', dates[inverse[offset + codes]])
+        offset += len(batch_stamps)
+        frames.append(_date_features(frame, compact))
+    return frames, formats
+
+
+def _date_features(df, compact=False):
+    """Drop messages without a valid date and add the date features"""
+    # Drop rows with invalid dates
+    df = df.dropna(subset=['date'])
+
+    if compact:
+        # Users become integer codes; date features are left to date_feature
+        df['user'] = df['user'].astype('category')
+        return df
+
+    # Extract date features
+    df['year'] = df['date'].dt.year
+    df['month_num'] = df['date'].dt.month
+    df['month'] = df['date'].dt.month_name()
+    df['day'] = df['date'].dt.day
+    df['day_name'] = df['date'].dt.day_name()
+    df['hour'] = df['date'].dt.hour
+    df['minute'] = df['date'].dt.minute
+
+    return df
+
+
+def _concat_frames(frames):
+    """Concatenate batches, keeping `user` categorical across batches with different users"""
+    if len(frames) == 1:
+        return frames[0]
+
+    if isinstance(frames[0]['user'].dtype, pd.CategoricalDtype):
+        users = union_categoricals([frame['user'] for frame in frames], sort_categories=True).categories
+        aligned = []
+        for frame in frames:
+            if not frame['user'].cat.categories.equals(users):
+                # Shallow copy so the caller's frame is left untouched
+                frame = frame.copy(deep=False)
+                frame['user'] = frame['user'].cat.set_categories(users)
+            aligned.append(frame)
+        frames = aligned
+
+    return pd.concat(frames)
+
+
+def _parse_lines(lines, batch_size=BATCH_SIZE):
+    """Collect the messages of an iterable of lines (see _collect)"""
+    return _collect(iter_message_batches(lines, batch_size))
+
+
+def _finish(collected, compact, formats=None):
+    if not collected:
+        # If no timestamps found, return empty DataFrame with correct columns and dtypes
+        collected = _collect([{'message_date': [], 'user': [], 'message': []}])
+
+    frames, formats = _date_frames(collected, compact, formats)
+    df = _concat_frames(frames).reset_index(drop=True)
+    # The layout the chat was read in, e.g. to read a re-export's new messages the same way
+    df.attrs['formats'] = formats
+    return df
+
+
+def preprocess(data, batch_size=BATCH_SIZE, compact=False, workers=None, formats=None):
     """
     Preprocess WhatsApp chat data to convert it into a structured DataFrame
     Supports multiple date-time formats
+
+    `data` is either the decoded chat text or any iterable of lines
+    (e.g. an open text file), which is parsed without loading it whole.
+    With `compact=True` only date, user (categorical) and message are stored;
+    the other columns are available through date_feature.
+    With `workers` > 1, chat text is split at message boundaries and parsed on a process pool.
+    The timestamp layout (day/month order, year width) is sniffed over all of the chat's
+    timestamps and kept in the result's attrs['formats'];
+    `formats` (from sniff_date_format) skips sniffing, e.g. when parsing the tail of a known chat.
     """
-    # First try with standard format: DD/MM/YY, 12-hour format (e.g., 01/02/21, 3:04 pm - )
-    pattern1 = r'\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}(?:\u202f|\s)?[ap]m\s-\s'
-    
-    # Alternative format: DD/MM/YY, 24-hour format (e.g., 01/02/21, 15:04 - )
-    pattern2 = r'\d{1,2}/\d{1,2}/\d{2,4},\s\d{1,2}:\d{2}\s-\s'
-    
-    # Try first pattern
-    dates = re.findall(pattern1, data)
-    pattern_used = pattern1
-    
-    # If first pattern doesn't match, try second pattern
-    if not dates:
-        dates = re.findall(pattern2, data)
-        pattern_used = pattern2
-    
-    # If we have matches, split the messages
-    if dates:
-        messages = re.split(pattern_used, data)
-        
-        # Remove the first empty message (before the first timestamp)
-        if messages and messages[0] == '':
-            messages.pop(0)
-        
-        # Clean dates (remove Unicode spaces and trailing dash)
-        cleaned_dates = [d.replace('\u202f', ' ').replace(' -', '').strip() for d in dates]
-        
-        # Create DataFrame
-        df = pd.DataFrame({'user_message': messages, 'message_date': cleaned_dates})
-        
-        # Convert dates to datetime
-        try:
-            # First try 12-hour format
-            df['date'] = pd.to_datetime(df['message_date'], format='%d/%m/%y, %I:%M %p', errors='coerce')
-            
-            # If that fails, try 24-hour format
-            if df['date'].isna().all():
-                df['date'] = pd.to_datetime(df['message_date'], format='%d/%m/%y, %H:%M', errors='coerce')
-            
-            # If there are still NAs, try another common format
-            if df['date'].isna().any():
-                mask = df['date'].isna()
-                df.loc[mask, 'date'] = pd.to_datetime(
-                    df.loc[mask, 'message_date'], format='%m/%d/%y, %I:%M %p', errors='coerce')
-            
-            # Try yet another format if needed
-            if df['date'].isna().any():
-                mask = df['date'].isna()
-                df.loc[mask, 'date'] = pd.to_datetime(
-                    df.loc[mask, 'message_date'], format='%d/%m/%Y, %I:%M %p', errors='coerce')
-            
-        except Exception as e:
-            print(f"Error converting dates: {e}")
-            # Fallback to a more flexible parser
-            try:
-                df['date'] = pd.to_datetime(df['message_date'], errors='coerce')
-            except:
-                # Last resort: create dummy dates
-                print("Failed to parse dates, using dummy values")
-                start_date = datetime.datetime(2020, 1, 1)
-                df['date'] = [start_date + datetime.timedelta(minutes=i) for i in range(len(df))]
-        
-        # Drop rows with invalid dates and the original message_date column
-        df = df.dropna(subset=['date'])
-        df.drop(columns=['message_date'], inplace=True)
-        
-        # Extract users and messages
-        users = []
-        messages_content = []
-        
-        for message in df['user_message']:
-            # Try to split on first colon (sender: message)
-            entry = re.split(r'(.*?):\s', message, maxsplit=1)
-            
-            if len(entry) >= 3:
-                # Format is correct: [empty or previous text, sender, message]
-                # Get the last two elements if there are more than 3
-                sender = entry[-2]
-                message_content = entry[-1]
-                users.append(sender)
-                messages_content.append(message_content)
-            else:
-                # System or group notification (no sender)
-                users.append('group_notification')
-                messages_content.append(message.strip())
-        
-        # Add to DataFrame
-        df['user'] = users
-        df['message'] = messages_content
-        
-        # Drop the raw user_message column
-        df.drop(columns=['user_message'], inplace=True)
-        
-        # Extract date features
-        df['year'] = df['date'].dt.year
-        df['month_num'] = df['date'].dt.month
-        df['month'] = df['date'].dt.month_name()
-        df['day'] = df['date'].dt.day
-        df['day_name'] = df['date'].dt.day_name()
-        df['hour'] = df['date'].dt.hour
-        df['minute'] = df['date'].dt.minute
-        
+    if isinstance(data, str):
+        if workers is not None and workers > 1:
+            return _parse_parallel(_split_text(data, workers), batch_size, compact, workers, formats)
+        # Scanned in place, with universal newlines as when the export is read in text mode
+        return _finish(_collect(iter_buffer_batches(data, batch_size)), compact, formats)
+
+    return _finish(_parse_lines(data, batch_size), compact, formats)
+
+
+def preprocess_buffer(data, batch_size=BATCH_SIZE, compact=False, formats=None, start=0, end=None,
+                      progress=None):
+    """
+    preprocess over the raw bytes of an export (bytes, memoryview or mmap), e.g. a memory-mapped
+    file or an upload's buffer, without decoding it whole. A UTF-8 byte order mark is skipped;
+    UTF-16 exports (which start with a BOM) are decoded and parsed as text.
+    `progress` is called with the fraction parsed so far (see iter_buffer_batches).
+    """
+    if start == 0 and bytes(data[:2]) in UTF16_BOMS:
+        return preprocess(str(data, 'utf-16').removeprefix('\ufeff'), batch_size, compact, formats=formats)
+
+    batches = iter_buffer_batches(data, batch_size, start, end, progress)
+    return _finish(_collect(batches), compact, formats)
+
+
+def concat(frames):
+    """Concatenate preprocessed DataFrames (e.g. of several chats), keeping `user` categorical"""
+    return _concat_frames(frames).reset_index(drop=True)
+
+
+def append(df, new_rows):
+    """Append newly parsed rows to a preprocessed DataFrame"""
+    if new_rows.empty:
         return df
+    if df.empty:
+        return new_rows.reset_index(drop=True)
+    return concat([df, new_rows])
+
+
+def last_message_offset(data):
+    """Byte offset of the line where the last message of an encoded chat export starts (None if there is none)"""
+    # Scan a growing window at the end of the export for the last message header
+    window = 64 * 1024
+    while True:
+        start = max(0, len(data) - window)
+        last = None
+        for last in _line_pattern(data, start).finditer(data, start):
+            pass
+        if last is not None:
+            return last.start()
+        if start == 0:
+            return None
+        window *= 4
+
+
+def preprocess_file(path, encoding='utf-8', batch_size=BATCH_SIZE, compact=False, workers=None):
+    """
+    Parse a chat export from disk. UTF-8 exports are memory-mapped and scanned as bytes
+    (see preprocess_buffer); other encodings are streamed through preprocess as text.
+    """
+    mapped = encoding.lower().replace('_', '-') in MAPPED_ENCODINGS
+    if workers is not None and workers > 1:
+        chunks = [(path, start, end, encoding) for start, end in _split_file(path, encoding, workers)]
+        return _parse_parallel(chunks, batch_size, compact, workers)
+
+    if mapped:
+        with _mapped(path) as data:
+            return preprocess_buffer(data, batch_size, compact)
+
+    with open(path, 'r', encoding=encoding) as f:
+        return preprocess(f, batch_size, compact)
+
+
+# Encodings whose exports are memory-mapped and scanned as bytes
+MAPPED_ENCODINGS = ('utf-8', 'utf8', 'utf-8-sig')
+
+
+@contextmanager
+def _mapped(path):
+    """Read-only memory map of a file (an empty bytes object for an empty file)"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+# ---------- Parallel Parsing ----------
+
+# Target size of a chunk handed to a worker; big files get more chunks than workers
+CHUNK_BYTES = 64 * 1024 ** 2
+
+# Workers are started fresh instead of forked: chats are parsed and compared from Streamlit
+# threads, and a child forked from a threaded process can deadlock on a lock held elsewhere
+MP_CONTEXT = multiprocessing.get_context('spawn')
+
+
+def _chunk_count(size, workers):
+    return max(workers, -(-size // CHUNK_BYTES))
+
+
+def _split_text(data, workers):
+    """Cut chat text into chunks that each start at a timestamp line"""
+    n_chunks = _chunk_count(len(data), workers)
+    step = max(1, len(data) // n_chunks)
+
+    cuts = [0]
+    for target in range(step, len(data), step):
+        pos = max(target, cuts[-1])
+        while True:
+            pos = data.find('\n', pos)
+            if pos == -1:
+                pos = len(data)
+                break
+            pos += 1
+            if LINE_PATTERN.match(data, pos):
+                break
+        if pos >= len(data):
+            break
+        if pos > cuts[-1]:
+            cuts.append(pos)
+    cuts.append(len(data))
+
+    return [data[start:end] for start, end in zip(cuts, cuts[1:])]
+
+
+def _split_file(path, encoding, workers):
+    """Byte ranges of a chat export that each start at a timestamp line"""
+    with open(path, 'rb') as f:
+        size = f.seek(0, io.SEEK_END)
+        step = max(1, size // _chunk_count(size, workers))
+
+        cuts = [0]
+        for target in range(step, size, step):
+            f.seek(max(target, cuts[-1]))
+            f.readline()  # Skip to the start of the next line
+            while True:
+                pos = f.tell()
+                line = f.readline()
+                if not line or LINE_PATTERN.match(line.decode(encoding, errors='replace')):
+                    break
+            if pos >= size:
+                break
+            if pos > cuts[-1]:
+                cuts.append(pos)
+        cuts.append(size)
+
+    return list(zip(cuts, cuts[1:]))
+
+
+def _parse_chunk(chunk, batch_size):
+    """Worker: collect the messages of chat text or a (path, start, end, encoding) byte range"""
+    if isinstance(chunk, str):
+        return _collect(iter_buffer_batches(chunk, batch_size))
     else:
-        # If no timestamps found, return empty DataFrame with correct columns
-        return pd.DataFrame(columns=['date', 'user', 'message', 'year', 'month_num', 
-                                    'month', 'day', 'day_name', 'hour', 'minute'])
\ No newline at end of file
+        path, start, end, encoding = chunk
+        if encoding.lower().replace('_', '-') in MAPPED_ENCODINGS:
+            # Workers map the file and scan only their own byte range
+            with _mapped(path) as data:
+                return _collect(iter_buffer_batches(data, batch_size, start, end))
+        else:
+            with open(path, 'rb') as f:
+                f.seek(start)
+                text = f.read(end - start).decode(encoding)
+            return _collect(iter_buffer_batches(text, batch_size))
+
+
+def _parse_parallel(chunks, batch_size, compact, workers, formats=None):
+    """
+    Collect the messages of chunks on a process pool, in order; their dates are then parsed
+    here, in one layout for the whole chat
+    """
+    with ProcessPoolExecutor(max_workers=workers, mp_context=MP_CONTEXT) as executor:
+        results = executor.map(_parse_chunk, chunks, repeat(batch_size))
+        collected = [batch for result in results for batch in result]
+
+    return _finish(collected, compact, formats)
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+from framecache import per_frame, per_frame_lru
+from aggregates import message_features
+from columns import user_codes, time_order
+from emojis import emoji_index
+from search import search_index
+from tokens import token_index
+import perf
+
+
+class ChatIndex:
+    """
+    Row index of a chat for slicing: message times in order and, for every user, the
+    positions of their messages in that order, so any (time range, users) selection
+    is a few binary searches instead of a scan of the frame.
+    """
+
+    def __init__(self, df):
+        times = df['date'].to_numpy(dtype='datetime64[ns]')
+        codes, users = user_codes(df)
+        self.users = users.astype(str)
+
+        self.order = time_order(times)
+        if self.order is not None:
+            times, codes = times[self.order], codes[self.order]
+        self.times = times
+
+        # Positions grouped by user, in time order within each user
+        self.user_rows = np.argsort(codes, kind='stable')
+        self.offsets = np.r_[0, np.cumsum(np.bincount(codes, minlength=len(self.users)))].astype(np.int64)
+
+    def _bound(self, when, default):
+        if when is None:
+            return default
+        return int(np.searchsorted(self.times, pd.Timestamp(when).to_datetime64(), side='left'))
+
+    def positions(self, start=None, end=None, users=None):
+        """Sorted row positions of the messages in [start, end) sent by `users` (None for everyone)"""
+        low, high = self._bound(start, 0), self._bound(end, len(self.times))
+
+        if users is None:
+            rows = np.arange(low, max(low, high))
+        else:
+            parts = []
+            for code in self.users.get_indexer(list(users)):
+                if code < 0:
+                    continue
+                group = self.user_rows[self.offsets[code]:self.offsets[code + 1]]
+                parts.append(group[np.searchsorted(group, low):np.searchsorted(group, high)])
+            rows = np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+        if self.order is not None:
+            rows = np.sort(self.order[rows])
+        return rows
+
+
+@per_frame
+def chat_index(df):
+    """ChatIndex for a preprocessed DataFrame, built once per frame"""
+    with perf.span('chat index', len(df)):
+        return ChatIndex(df)
+
+
+# Per-message structures that are sliced for a selection instead of rebuilt from its text
+SLICEABLE = [
+    (token_index, lambda index, positions: index.take(positions)),
+    (emoji_index, lambda index, positions: index.take(positions)),
+    (search_index, lambda index, positions: index.take(positions)),
+    (message_features, lambda features, positions: {name: values[positions] for name, values in features.items()}),
+]
+
+
+def select(df, start=None, end=None, users=None):
+    """
+    The messages of a chat sent in [start, end) by `users` (everyone if None), as a
+    frame every helper accepts in place of the whole chat. Selections are memoized
+    per chat; indexes already built for the chat are sliced rather than rebuilt.
+    """
+    key = (None if start is None else pd.Timestamp(start),
+           None if end is None else pd.Timestamp(end),
+           None if users is None else tuple(sorted(users)))
+    selection, positions = _select(df, key)
+
+    # Indexes built for the chat are sliced for the selection, including ones built after the
+    # selection was first made (e.g. the search index, on the chat's first search)
+    for builder, take in SLICEABLE:
+        built = builder.peek(df)
+        if built is not None and builder.peek(selection) is None:
+            with perf.span(f'slice {builder.__name__}', len(positions)):
+                builder.seed(selection, take(built, positions))
+    return selection
+
+
+@per_frame_lru(maxsize=16)
+def _select(df, key):
+    start, end, users = key
+    positions = chat_index(df).positions(start, end, users)
+
+    with perf.span('select', len(positions)):
+        return df.iloc[positions], positions
@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+from framecache import per_frame
+import perf
+from columns import NS_PER_MIN, user_codes, time_order
+
+# Replies slower than this are treated as new conversations, not responses
+MAX_REPLY_MINS = 24 * 60
+
+# Silence after which a new session starts
+SESSION_GAP_MINS = 60
+
+PERCENTILES = (50, 90, 99)
+
+
+def _group_quantiles(starts, counts, values, q):
+    """Linear-interpolated quantile `q` of every group of `values`, sorted within groups"""
+    position = starts + q * (counts - 1)
+    low = np.floor(position).astype(np.int64)
+    high = np.ceil(position).astype(np.int64)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def _runs(breaks, n):
+    """(first, last) positions of the runs of an n-item sequence, given where consecutive items differ"""
+    starts = np.flatnonzero(np.r_[True, breaks]) if n else np.zeros(0, dtype=np.int64)
+    ends = np.append(starts[1:], n)[:len(starts)] - 1
+    return starts, ends
+
+
+class ReplyIndex:
+    """
+    Conversation turns, replies and sessions of a chat, computed once on the full timeline.
+
+    A turn is a run of consecutive messages by one user; every turn after the first is a
+    reply to the previous turn's user, with its latency measured from the end of that turn.
+    Replies are stored grouped by the replying user so per-user figures are array slices.
+    """
+
+    def __init__(self, df, max_reply_mins=MAX_REPLY_MINS, session_gap_mins=SESSION_GAP_MINS):
+        df = df[(df['user'] != 'group_notification').to_numpy()]
+        times = df['date'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        codes, users = user_codes(df)
+        self.users = users.astype(str)
+        n_users = len(self.users)
+
+        order = time_order(times)
+        if order is not None:
+            times, codes = times[order], codes[order]
+
+        # Turns: runs of messages by the same user
+        turn_starts, turn_ends = _runs(codes[1:] != codes[:-1], len(codes))
+        self.turns = len(turn_starts)
+        turn_users = codes[turn_starts]
+
+        # Replies: each turn answers the one before it
+        latency = (times[turn_starts[1:]] - times[turn_ends[:-1]]) / NS_PER_MIN
+        keep = latency < max_reply_mins
+        repliers, replied_to, latency = turn_users[1:][keep], turn_users[:-1][keep], latency[keep]
+
+        # Grouped by replier, fastest first, with offsets into the groups
+        order = np.lexsort((latency, repliers))
+        self.repliers = repliers[order]
+        self.replied_to = replied_to[order]
+        self.latency_mins = latency[order]
+        self.offsets = np.r_[0, np.cumsum(np.bincount(self.repliers, minlength=n_users))].astype(np.int64)
+
+        # Sessions: split wherever the chat is silent for longer than the gap
+        session_starts, session_ends = _runs(np.diff(times) > session_gap_mins * NS_PER_MIN, len(times))
+        session_ids = np.repeat(np.arange(len(session_starts)), session_ends - session_starts + 1)
+        self.session_start = times[session_starts]
+        self.session_end = times[session_ends]
+        self.session_messages = np.bincount(session_ids, minlength=len(session_starts))
+        self.session_opener = codes[session_starts]
+
+        # Distinct (session, user) pairs tell who took part in each session
+        pairs = np.unique(session_ids * max(n_users, 1) + codes)
+        self.session_pairs = np.column_stack([pairs // max(n_users, 1), pairs % max(n_users, 1)])
+
+    def _code(self, selected_user):
+        return self.users.get_loc(selected_user) if selected_user in self.users else None
+
+    def _slice(self, selected_user):
+        if selected_user == 'Overall':
+            return slice(None)
+        code = self._code(selected_user)
+        if code is None:
+            return slice(0, 0)
+        return slice(self.offsets[code], self.offsets[code + 1])
+
+    def latencies(self, selected_user='Overall'):
+        """Reply latencies in minutes of replies written by a user ('Overall' for everyone)"""
+        return self.latency_mins[self._slice(selected_user)]
+
+    def reply_frame(self, selected_user='Overall'):
+        """One row per reply: who replied, to whom, and how many minutes it took"""
+        part = self._slice(selected_user)
+        return pd.DataFrame({
+            'user': self.users[self.repliers[part]],
+            'replied_to': self.users[self.replied_to[part]],
+            'response_mins': self.latency_mins[part],
+        })
+
+    def percentiles(self, selected_user='Overall', q=PERCENTILES):
+        """{'p50': ..., 'p90': ..., 'p99': ...} of a user's reply latencies (NaN without replies)"""
+        latencies = self.latencies(selected_user)
+        if latencies.size == 0:
+            return {f'p{p}': np.nan for p in q}
+        return {f'p{p}': float(value) for p, value in zip(q, np.percentile(latencies, q))}
+
+    def summary(self, q=PERCENTILES):
+        """Replies, mean and percentile latency of every user who replied"""
+        counts = np.diff(self.offsets)
+        users = np.flatnonzero(counts)
+        starts, counts = self.offsets[users], counts[users]
+        frame = pd.DataFrame({
+            'user': self.users[users],
+            'replies': counts,
+            'mean_mins': np.add.reduceat(self.latency_mins, starts) / counts if users.size else np.zeros(0),
+        })
+        for p in q:
+            frame[f'p{p}_mins'] = _group_quantiles(starts, counts, self.latency_mins, p / 100)
+        return frame.sort_values('replies', ascending=False, ignore_index=True)
+
+    def matrix(self, q=0.5):
+        """Quantile reply latency (median by default) of every replier (rows) to every user (columns)"""
+        n_users = len(self.users)
+        pairs = self.repliers * n_users + self.replied_to
+        order = np.lexsort((self.latency_mins, pairs))
+        pairs, values = pairs[order], self.latency_mins[order]
+
+        keys, starts, counts = np.unique(pairs, return_index=True, return_counts=True)
+        grid = np.full(n_users * n_users, np.nan)
+        grid[keys] = _group_quantiles(starts, counts, values, q)
+        return pd.DataFrame(grid.reshape(n_users, n_users), index=self.users, columns=self.users)
+
+    def sessions(self, selected_user='Overall'):
+        """One row per session (the ones a user took part in, unless 'Overall')"""
+        ids = np.arange(len(self.session_start))
+        if selected_user != 'Overall':
+            code = self._code(selected_user)
+            ids = self.session_pairs[self.session_pairs[:, 1] == code, 0] if code is not None else ids[:0]
+        participants = np.bincount(self.session_pairs[:, 0], minlength=len(self.session_start))
+        return pd.DataFrame({
+            'start': pd.to_datetime(self.session_start[ids]),
+            'end': pd.to_datetime(self.session_end[ids]),
+            'messages': self.session_messages[ids],
+            'participants': participants[ids],
+            'opened_by': self.users[self.session_opener[ids]],
+            'duration_mins': (self.session_end[ids] - self.session_start[ids]) / NS_PER_MIN,
+        })
+
+
+@per_frame
+def reply_index(df):
+    """ReplyIndex for a preprocessed DataFrame, built once per frame"""
+    with perf.span('reply index', len(df)):
+        return ReplyIndex(df)
@@ -0,0 +1,151 @@
+"""
+Full-text search over the messages of a chat.
+
+Messages are split into lowercase words once, on the chat's first search, and every word
+gets a posting list of (row, position in the message) pairs. A word is one lookup, a
+phrase (or a URL, which is a phrase of its words) intersects the posting lists of its
+words at consecutive positions, so no search scans the messages themselves.
+"""
+import copy
+import re
+from itertools import chain
+import numpy as np
+import pandas as pd
+from framecache import per_frame
+import perf
+
+WORD_PATTERN = r'\w+'
+
+# Record separator joining the messages so they are split in one regex pass; never part of a word
+SEPARATOR = '\x1e'
+
+# Characters of context shown on each side of a match
+SNIPPET_CONTEXT = 60
+
+
+def tokenize(text):
+    """Lowercase words of a message or query, as the index splits them"""
+    return re.findall(WORD_PATTERN, text.lower())
+
+
+def _empty():
+    return np.zeros(0, dtype=np.int64)
+
+
+def _words(messages):
+    """All words of a list of messages in order, with the row each word comes from"""
+    text = SEPARATOR.join(messages).lower()
+    if text.count(SEPARATOR) != max(len(messages) - 1, 0):
+        # Some message contains the separator itself: split them one at a time
+        words = [tokenize(message) for message in messages]
+        lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        return np.array(list(chain.from_iterable(words)), dtype=object), np.repeat(np.arange(len(words)), lengths)
+
+    tokens = np.array(re.findall(WORD_PATTERN + '|' + SEPARATOR, text), dtype=object)
+    separators = tokens == SEPARATOR
+    return tokens[~separators], np.cumsum(separators)[~separators]
+
+
+class SearchIndex:
+    """
+    Inverted index of a chat: for every word of `vocab`, the rows and word positions
+    where it occurs, stored together and sorted by (word, row, position).
+    """
+
+    def __init__(self, df):
+        words, rows = _words(df['message'].astype(str).tolist())
+        codes, vocab = pd.factorize(words)
+
+        # Position of every word in its message
+        lengths = np.bincount(rows, minlength=len(df))
+        positions = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        self._postings(pd.Index(vocab, dtype=object), codes, rows.astype(np.int32), positions.astype(np.int32))
+
+    def _postings(self, vocab, codes, rows, positions, ordered=False):
+        # Group the postings by word; a stable sort keeps each word's (row, position) order
+        order = slice(None) if ordered else np.argsort(codes, kind='stable')
+        self.vocab = vocab
+        self.rows = rows[order]
+        self.positions = positions[order]
+        self.offsets = np.r_[0, np.cumsum(np.bincount(codes, minlength=len(vocab)))].astype(np.int64)
+
+    def _codes(self):
+        # Word of every posting
+        return np.repeat(np.arange(len(self.vocab)), np.diff(self.offsets))
+
+    def postings(self, word):
+        """(rows, positions) where a word occurs"""
+        code = self.vocab.get_indexer([word])[0]
+        if code < 0:
+            return _empty(), _empty()
+        part = slice(self.offsets[code], self.offsets[code + 1])
+        return self.rows[part], self.positions[part]
+
+    def search(self, query):
+        """Sorted rows of the messages containing the words of `query` as a phrase"""
+        words = tokenize(query)
+        if not words:
+            return _empty()
+
+        # Phrase matches are (row, start position) pairs present for every word, shifted by its offset
+        rows, positions = self.postings(words[0])
+        starts = (rows.astype(np.int64) << 32) | positions
+        for offset, word in enumerate(words[1:], 1):
+            rows, positions = self.postings(word)
+            shifted = positions.astype(np.int64) - offset
+            keep = shifted >= 0
+            starts = np.intersect1d(starts, (rows[keep].astype(np.int64) << 32) | shifted[keep], assume_unique=True)
+        return np.unique(starts >> 32)
+
+    def take(self, positions):
+        """SearchIndex of the messages at sorted `positions`, with rows renumbered to match"""
+        found = np.searchsorted(positions, self.rows)
+        hit = found < len(positions)
+        hit[hit] = positions[found[hit]] == self.rows[hit]
+        index = copy.copy(self)
+        index._postings(self.vocab, self._codes()[hit], found[hit].astype(np.int32), self.positions[hit], ordered=True)
+        return index
+
+    def append(self, other, first_row):
+        """
+        Replace the rows from `first_row` on with the messages indexed by `other`
+        (e.g. the new messages of a re-export), without re-indexing the rest.
+        """
+        keep = self.rows < first_row
+        vocab = self.vocab.append(other.vocab.difference(self.vocab, sort=False))
+        codes = np.concatenate([self._codes()[keep], vocab.get_indexer(other.vocab)[other._codes()]])
+        rows = np.concatenate([self.rows[keep], other.rows + np.int32(first_row)])
+        positions = np.concatenate([self.positions[keep], other.positions])
+        self._postings(vocab, codes, rows, positions)
+        return self
+
+    def save(self, path):
+        # Words can't contain newlines, so the vocabulary is stored as one joined string
+        vocab = np.frombuffer('\n'.join(self.vocab).encode('utf-8'), dtype=np.uint8)
+        np.savez(path, vocab=vocab, rows=self.rows, positions=self.positions, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path):
+        index = cls.__new__(cls)
+        with np.load(path) as arrays:
+            vocab = arrays['vocab'].tobytes().decode('utf-8')
+            index.vocab = pd.Index(vocab.split('\n') if len(arrays['offsets']) > 1 else [], dtype=object)
+            index.rows, index.positions, index.offsets = arrays['rows'], arrays['positions'], arrays['offsets']
+        return index
+
+
+@per_frame
+def search_index(df):
+    """SearchIndex for a preprocessed DataFrame, built once per frame"""
+    with perf.span('search index', len(df)):
+        return SearchIndex(df)
+
+
+def snippet(text, query, context=SNIPPET_CONTEXT):
+    """The first match of `query` in a message with up to `context` characters around it"""
+    words = tokenize(query)
+    match = re.search(r'(?<!\w)' + r'\W+'.join(map(re.escape, words)) + r'(?!\w)', text, re.IGNORECASE) if words else None
+    if match is None:
+        return text[:2 * context]
+    start, end = max(0, match.start() - context), min(len(text), match.end() + context)
+    return ('…' if start else '') + text[start:end].replace('\n', ' ') + ('…' if end < len(text) else '')
@@ -0,0 +1,97 @@
+import os
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from framecache import per_frame
+from tokens import token_index
+import perf
+
+# Optional lexicon file used instead of the built-in word lists (override with CHAT_ANALYZER_LEXICON)
+LEXICON_FILE = os.environ.get('CHAT_ANALYZER_LEXICON')
+
+# Built-in lexicon if no file is configured
+POSITIVE_WORDS = ['happy', 'love', 'great', 'good', 'nice', 'thanks', 'awesome', 'amazing', 'excellent', 'wonderful', 'joy']
+NEGATIVE_WORDS = ['sad', 'bad', 'hate', 'terrible', 'awful', 'sorry', 'angry', 'upset', 'disappointed', 'problem', 'fail']
+
+# Same normalization constant as VADER's compound score
+NORMALIZE_ALPHA = 15
+
+LABELS = ['Positive', 'Negative', 'Neutral']
+
+
+class Lexicon:
+    """Sentiment score of every word, looked up for a whole vocabulary at once"""
+
+    def __init__(self, scores):
+        scores = pd.Series(scores, dtype=np.float64)
+        # Last entry wins, like a dict
+        self.scores = scores[~scores.index.duplicated(keep='last')]
+
+    def weights(self, vocab):
+        """Score of every token of `vocab` (0 for words not in the lexicon)"""
+        return self.scores.reindex(vocab).fillna(0.0).to_numpy()
+
+
+DEFAULT_LEXICON = Lexicon({**{word: 1.0 for word in POSITIVE_WORDS},
+                           **{word: -1.0 for word in NEGATIVE_WORDS}})
+
+
+@lru_cache(maxsize=None)
+def load_lexicon(path):
+    """
+    Read a lexicon file once per process. Each line is a word and its score separated
+    by a tab (VADER's vader_lexicon.txt, extra columns are ignored), a comma or spaces;
+    blank lines, '#' comments and lines without a numeric score are skipped.
+    """
+    scores = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            for separator in ('\t', ',', None):
+                fields = line.split(separator)
+                if len(fields) >= 2:
+                    break
+            try:
+                scores[fields[0].strip().lower()] = float(fields[1])
+            except (IndexError, ValueError):
+                continue
+    return Lexicon(scores)
+
+
+def default_lexicon():
+    """The configured lexicon file, or the built-in word lists if there is none"""
+    if LEXICON_FILE:
+        try:
+            return load_lexicon(LEXICON_FILE)
+        except OSError as e:
+            print(f"Error loading lexicon {LEXICON_FILE}: {e}")
+    return DEFAULT_LEXICON
+
+
+@per_frame
+def _frame_scores(df):
+    # Message scores of a frame, by lexicon
+    return {}
+
+
+def message_scores(df, lexicon=None):
+    """Summed lexicon score of every message, computed once per frame and lexicon"""
+    lexicon = lexicon or default_lexicon()
+    scores = _frame_scores(df)
+    if id(lexicon) not in scores:
+        with perf.span('sentiment scores', len(df)):
+            index = token_index(df)
+            # Scores are looked up per vocabulary token, then summed per message
+            scores[id(lexicon)] = (lexicon, index.message_sums(lexicon.weights(index.vocab)))
+    return scores[id(lexicon)][1]
+
+
+def normalize(scores):
+    """Map summed scores to [-1, 1] the way VADER's compound score does"""
+    return scores / np.sqrt(scores * scores + NORMALIZE_ALPHA)
+
+
+def labels(scores):
+    return np.select([scores > 0, scores < 0], LABELS[:2], LABELS[2])
@@ -0,0 +1,111 @@
+"""
+Synthetic WhatsApp chat exports for benchmarks.
+
+    python synthetic.py 1000000 -o chat.txt --users 50 --clock 24h --locale mdy
+"""
+import argparse
+import datetime
+import random
+import sys
+
+WORDS = ("hello hi yaar kya scene hai bhai ok okay haan nahi kal aaj meeting call done thanks "
+         "love good bad sad happy great sorry problem lol please send photo where when why how "
+         "the and is in to of for this that it me my you your na se ho par").split()
+EMOJIS = ['😂', '❤️', '👍', '🙏', '😍', '🔥', '😭', '👍🏽', '🇮🇳', '👨‍👩‍👧', '🎉', '😅']
+DOMAINS = ['youtube.com', 'instagram.com', 'github.com', 'example.org', 'docs.google.com']
+
+# Timestamp layouts of real exports
+LOCALES = {
+    'dmy': '%d/%m/%y',
+    'mdy': '%m/%d/%y',
+    'dmY': '%d/%m/%Y',
+}
+
+
+def _user_names(n_users, rng):
+    names = []
+    for i in range(n_users):
+        if rng.random() < 0.2:
+            names.append(f"+91 9{rng.randint(0, 9999):04d} {rng.randint(0, 99999):05d}")
+        else:
+            names.append(f"User {i}")
+    return names
+
+
+def _timestamp(when, clock, date_format):
+    date = when.strftime(date_format)
+    if clock == '24h':
+        return f"{date}, {when:%H:%M}"
+    hour = when.hour % 12 or 12
+    return f"{date}, {hour}:{when:%M} {'am' if when.hour < 12 else 'pm'}"
+
+
+def generate_lines(messages, users=10, multiline_ratio=0.05, emoji_density=0.2, url_density=0.02,
+                   media_ratio=0.03, notification_ratio=0.01, clock='12h', locale='dmy',
+                   start=datetime.datetime(2020, 1, 1), seed=0):
+    """Yield the lines of a synthetic export with `messages` messages"""
+    rng = random.Random(seed)
+    names = _user_names(users, rng)
+    date_format = LOCALES[locale]
+    when = start
+
+    for _ in range(messages):
+        # Bursty traffic: mostly quick replies, sometimes long silences
+        when += datetime.timedelta(seconds=rng.expovariate(1 / 600) if rng.random() < 0.95 else rng.expovariate(1 / 36000))
+        stamp = _timestamp(when, clock, date_format)
+
+        if rng.random() < notification_ratio:
+            yield f"{stamp} - {rng.choice(names)} added {rng.choice(names)}\n"
+            continue
+
+        sender = rng.choice(names)
+        if rng.random() < media_ratio:
+            yield f"{stamp} - {sender}: <Media omitted>\n"
+            continue
+
+        words = rng.choices(WORDS, k=rng.randint(1, 15))
+        if rng.random() < emoji_density:
+            words.insert(rng.randint(0, len(words)), ''.join(rng.choices(EMOJIS, k=rng.randint(1, 3))))
+        if rng.random() < url_density:
+            words.append(f"https://{rng.choice(DOMAINS)}/{rng.randint(0, 10 ** 6)}")
+        yield f"{stamp} - {sender}: {' '.join(words)}\n"
+
+        if rng.random() < multiline_ratio:
+            for _ in range(rng.randint(1, 3)):
+                yield ' '.join(rng.choices(WORDS, k=rng.randint(1, 10))) + '\n'
+
+
+def generate_chat(messages, **options):
+    """A synthetic export as a string"""
+    return ''.join(generate_lines(messages, **options))
+
+
+def write_chat(path, messages, **options):
+    """Write a synthetic export to `path` without holding it in memory"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(generate_lines(messages, **options))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic WhatsApp chat export")
+    parser.add_argument('messages', type=int)
+    parser.add_argument('-o', '--output', help="file to write (default: stdout)")
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--multiline-ratio', type=float, default=0.05)
+    parser.add_argument('--emoji-density', type=float, default=0.2)
+    parser.add_argument('--url-density', type=float, default=0.02)
+    parser.add_argument('--clock', choices=['12h', '24h'], default='12h')
+    parser.add_argument('--locale', choices=sorted(LOCALES), default='dmy')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    options = dict(users=args.users, multiline_ratio=args.multiline_ratio, emoji_density=args.emoji_density,
+                   url_density=args.url_density, clock=args.clock, locale=args.locale, seed=args.seed)
+    if args.output:
+        write_chat(args.output, args.messages, **options)
+    else:
+        sys.stdout.writelines(generate_lines(args.messages, **options))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+import pandas as pd
+import aggregates
+import helper
+import preprocessor
+
+MESSAGES = [
+    'http://192.168.0.1/x',
+    'router at 10.0.0.1 and http://localhost:8000/a',
+    'see example.com and https://www.python.org/',
+    'version 3.5 costs 1,000.50',
+    'no links here',
+]
+
+
+def test_link_counts_match_url_extract():
+    expected = [len(aggregates.extract.find_urls(message)) for message in MESSAGES]
+    assert expected[0] == 1
+    assert aggregates.link_counts(pd.Series(MESSAGES)).tolist() == expected
+
+
+def test_empty_chat_helpers():
+    df = preprocessor.preprocess('')
+    assert helper.monthly_timeline('Alice', df).empty
+    assert helper.hourly_activity('Alice', df)['message'].sum() == 0
+    assert helper.week_activity_map('Alice', df).sum() == 0
@@ -0,0 +1,47 @@
+import threading
+import time
+import pandas as pd
+from framecache import per_frame, per_frame_lru
+
+
+def test_cached_lookup_does_not_wait_for_another_frames_build():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    @per_frame
+    def slow(df):
+        calls.append(len(df))
+        if len(df) > 1:
+            started.set()
+            release.wait(5)
+        return len(df)
+
+    small, big = pd.DataFrame({'a': [1]}), pd.DataFrame({'a': [1, 2]})
+    assert slow(small) == 1
+    builder = threading.Thread(target=slow, args=(big,))
+    builder.start()
+    started.wait(5)
+    start = time.perf_counter()
+    assert slow(small) == 1 and slow.peek(small) == 1 and slow.peek(big) is None
+    assert time.perf_counter() - start < 1
+    release.set()
+    builder.join()
+    assert slow(big) == 2 and calls == [1, 2]
+
+
+def test_concurrent_calls_build_once():
+    calls = []
+
+    @per_frame_lru(maxsize=2)
+    def build(df, key):
+        calls.append(key)
+        time.sleep(0.05)
+        return key * 2
+
+    df = pd.DataFrame({'a': [1]})
+    threads = [threading.Thread(target=build, args=(df, 'x')) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ['x'] and build(df, 'x') == 'xx'
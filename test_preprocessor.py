@@ -0,0 +1,65 @@
+import pandas as pd
+import preprocessor
+
+BOM_EXPORT = b'\xef\xbb\xbf01/02/21, 15:04 - Alice: hi\n13/02/21, 11:04 - Bob: yo\n'
+
+
+def test_bom_upload_keeps_first_message():
+    df = preprocessor.preprocess_buffer(BOM_EXPORT)
+    assert df['user'].tolist() == ['Alice', 'Bob']
+    assert df['message'].tolist() == ['hi\n', 'yo\n']
+
+
+def test_bom_text_keeps_first_message():
+    df = preprocessor.preprocess(BOM_EXPORT.decode('utf-8'))
+    pd.testing.assert_frame_equal(df, preprocessor.preprocess_buffer(BOM_EXPORT))
+
+
+def test_bom_mapped_file_keeps_first_message(tmp_path):
+    path = tmp_path / 'chat.txt'
+    path.write_bytes(BOM_EXPORT)
+    assert preprocessor.preprocess_file(path)['user'].tolist() == ['Alice', 'Bob']
+
+
+def test_bom_parallel_keeps_first_message(tmp_path):
+    path = tmp_path / 'chat.txt'
+    path.write_bytes(BOM_EXPORT + BOM_EXPORT[3:] * 49)
+    df = preprocessor.preprocess_file(path, workers=2)
+    assert len(df) == 100
+    assert df['user'].tolist()[:2] == ['Alice', 'Bob']
+
+
+def test_bom_last_message_offset():
+    one_message = BOM_EXPORT.split(b'\n')[0] + b'\n'
+    assert preprocessor.last_message_offset(one_message) == 0
+    assert preprocessor.last_message_offset(BOM_EXPORT) == BOM_EXPORT.index(b'13/02')
+
+
+def test_buffer_and_text_parsers_agree():
+    export = (
+        '01/02/21, 15:04 - Alice:\nsecond line\n'
+        '01/02/21, 15:05 - Bob: crlf\r\nmore\r\n'
+        '01/02/21,\xa03:06 pm - Carol: spaces\n'
+        '01/02/21, 15:07 -\nnotification on the next line\n'
+        '01/02/21, 15:08 - Alice created group "x"\n'
+        '01/02/21, 15:09 - Dave: odd space\rold mac line\r'
+        '01/02/21, 15:10 - Erin: last'
+    ).encode('utf-8')
+    expected = preprocessor.preprocess(export.decode('utf-8'))
+    assert expected['user'].tolist() == ['Alice', 'Bob', 'Carol', 'group_notification',
+                                         'group_notification', 'Dave', 'Erin']
+    pd.testing.assert_frame_equal(preprocessor.preprocess_buffer(export), expected)
+    # Old Mac (lone \r) line breaks
+    export = export.replace(b'\n', b'\r')
+    pd.testing.assert_frame_equal(preprocessor.preprocess_buffer(export), preprocessor.preprocess(export.decode('utf-8')))
+
+
+def test_month_first_chat_gets_one_layout(tmp_path):
+    # Only messages after the 12th of a month prove the layout; they come late in the chat
+    stamps = pd.date_range('2021-01-01', periods=3000, freq='10min')
+    export = ''.join(f'{t:%m/%d/%y, %H:%M} - Al: hi\n' for t in stamps)
+    path = tmp_path / 'chat.txt'
+    path.write_text(export)
+    for df in (preprocessor.preprocess(export), preprocessor.preprocess_buffer(export.encode()),
+               preprocessor.preprocess_file(path, workers=2)):
+        assert df['date'].tolist() == stamps.tolist()
@@ -0,0 +1,103 @@
+"""
+Message counts over time at any resolution, from one conversion of the `date` column.
+
+Dates are turned into int64 minutes since the epoch once per chat and grouped by user, so
+every time view (a timeline at some resolution, the weekday x hour heatmap, rolling
+windows) is one np.bincount over a user's slice of those minutes.
+"""
+import numpy as np
+import pandas as pd
+from framecache import per_frame
+from preprocessor import DAYS
+from columns import NS_PER_MIN, user_codes
+import perf
+
+MINUTE, HOUR, DAY, WEEK, MONTH = 'minute', 'hour', 'day', 'week', 'month'
+
+# Width of the fixed-size resolutions in minutes
+WIDTHS = {MINUTE: 1, HOUR: 60, DAY: 24 * 60, WEEK: 7 * 24 * 60}
+
+# 1970-01-01 was a Thursday; shifting by 3 days makes weeks (and weekday 0) start on Monday
+EPOCH_WEEKDAY = 3
+
+
+def epoch_minutes(dates):
+    """Minutes since the epoch of a datetime column, as int64"""
+    return dates.to_numpy(dtype='datetime64[ns]').view(np.int64) // NS_PER_MIN
+
+
+def _bins(minutes, resolution):
+    # Bin number of every minute and the start (as a datetime) of bin number b
+    if resolution == MONTH:
+        bins = minutes.astype('datetime64[m]').astype('datetime64[M]').astype(np.int64)
+        return bins, lambda b: b.astype('datetime64[M]')
+    if resolution not in WIDTHS:
+        raise ValueError(f"Unknown resolution {resolution!r}, expected one of {[*WIDTHS, MONTH]}")
+    width = WIDTHS[resolution]
+    shift = EPOCH_WEEKDAY * WIDTHS[DAY] if resolution == WEEK else 0
+    bins = (minutes + shift) // width
+    return bins, lambda b: (b * width - shift).astype('datetime64[m]')
+
+
+def bucket_counts(minutes, resolution=DAY):
+    """Counts of epoch minutes per bin, from the first to the last bin with any (empty bins included)"""
+    bins, start_of = _bins(minutes, resolution)
+    if bins.size == 0:
+        return pd.Series([], index=pd.DatetimeIndex([], name='date'), name='message', dtype=np.int64)
+    first = bins.min()
+    counts = np.bincount(bins - first)
+    dates = start_of(np.arange(first, first + counts.size)).astype('datetime64[ns]')
+    return pd.Series(counts, index=pd.DatetimeIndex(dates, name='date'), name='message')
+
+
+class TimeBuckets:
+    """
+    Minutes since the epoch of every message, grouped by user (in time order within
+    a user), with the offsets of each user's group.
+    """
+
+    def __init__(self, df):
+        minutes = epoch_minutes(df['date'])
+        codes, users = user_codes(df)
+        self.users = users.astype(str)
+
+        order = np.lexsort((minutes, codes))
+        self.minutes = minutes[order]
+        self.offsets = np.r_[0, np.cumsum(np.bincount(codes, minlength=len(self.users)))].astype(np.int64)
+
+    def user_minutes(self, selected_user='Overall'):
+        """Minutes of a user's messages ('Overall' for everyone)"""
+        if selected_user == 'Overall':
+            return self.minutes
+        if selected_user not in self.users:
+            return self.minutes[:0]
+        code = self.users.get_loc(selected_user)
+        return self.minutes[self.offsets[code]:self.offsets[code + 1]]
+
+    def counts(self, resolution=DAY, selected_user='Overall'):
+        """Messages per bin, from the first to the last bin with messages (empty bins included)"""
+        return bucket_counts(self.user_minutes(selected_user), resolution)
+
+    def rolling(self, window, resolution=DAY, selected_user='Overall', how='sum'):
+        """Messages over the last `window` bins at every bin (summed, or averaged per bin)"""
+        counts = self.counts(resolution, selected_user)
+        totals = np.cumsum(np.r_[0, counts.to_numpy()])
+        values = totals[1:] - totals[np.maximum(np.arange(1, totals.size) - window, 0)]
+        if how == 'mean':
+            values = values / np.minimum(np.arange(1, totals.size), window)
+        return pd.Series(values, index=counts.index, name='message')
+
+    def heatmap(self, selected_user='Overall'):
+        """Messages per weekday (rows, Monday first) and hour of the day (columns)"""
+        minutes = self.user_minutes(selected_user)
+        weekdays = (minutes // WIDTHS[DAY] + EPOCH_WEEKDAY) % 7
+        hours = minutes // WIDTHS[HOUR] % 24
+        grid = np.bincount(weekdays * 24 + hours, minlength=7 * 24).reshape(7, 24)
+        return pd.DataFrame(grid, index=pd.Index(DAYS, name='day_name'), columns=pd.RangeIndex(24, name='hour'))
+
+
+@per_frame
+def time_buckets(df):
+    """TimeBuckets for a preprocessed DataFrame, built once per frame"""
+    with perf.span('time buckets', len(df)):
+        return TimeBuckets(df)
@@ -0,0 +1,145 @@
+import copy
+import os
+import re
+import string
+from functools import lru_cache
+from itertools import chain
+import numpy as np
+import pandas as pd
+from framecache import per_frame
+import perf
+
+STOP_WORDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stop_hinglish.txt')
+
+# Basic stopwords if file not found
+DEFAULT_STOP_WORDS = ["the", "and", "is", "in", "to", "of", "a", "for", "hai", "ki", "ko", "ka", "tha",
+                      "this", "that", "it", "me", "my", "you", "your", "na", "se", "ha", "was", "ho", "par"]
+
+MEDIA_MESSAGE = '<Media omitted>\n'
+
+URL_PATTERN = r'http\S+'
+PUNCTUATION_PATTERN = f"[{re.escape(string.punctuation)}]"
+
+
+@lru_cache(maxsize=None)
+def load_stop_words(path=STOP_WORDS_FILE):
+    """Stopwords as a frozenset, read from disk once per process"""
+    try:
+        with open(path, 'r') as f:
+            return frozenset(f.read().splitlines())
+    except FileNotFoundError:
+        return frozenset(DEFAULT_STOP_WORDS)
+
+
+def take_rows(message_ids, positions):
+    """
+    Items (tokens, emojis, ...) of the messages at sorted `positions`, given the ascending
+    message id of every item: (indices of the items, their message ids renumbered to match).
+    """
+    starts = np.searchsorted(message_ids, positions, side='left')
+    lengths = np.searchsorted(message_ids, positions, side='right') - starts
+    # One run of consecutive item indices per selected message
+    run_starts = np.cumsum(lengths) - lengths
+    items = np.repeat(starts - run_starts, lengths) + np.arange(lengths.sum())
+    return items, np.repeat(np.arange(len(positions)), lengths)
+
+
+class TokenIndex:
+    """
+    Tokens of every message of a chat, computed once and shared by the text analytics.
+
+    Messages are cleaned (URLs and punctuation removed, lowercased) and split; every token
+    is stored as an id into `vocab`, with `message_ids` giving the row it came from.
+    """
+
+    def __init__(self, df, stop_words=None):
+        if stop_words is None:
+            stop_words = load_stop_words()
+
+        messages = df['message'].astype(str)
+        self.n_messages = len(messages)
+
+        # Messages the text analyses look at: no group notifications or media
+        self.text_mask = ((df['user'] != 'group_notification') & (messages != MEDIA_MESSAGE)).to_numpy()
+
+        cleaned = (messages.str.replace(URL_PATTERN, '', regex=True)
+                           .str.replace(PUNCTUATION_PATTERN, '', regex=True)
+                           .str.lower()
+                           .str.split())
+        lengths = cleaned.str.len().to_numpy()
+
+        codes, vocab = pd.factorize(np.fromiter(chain.from_iterable(cleaned), dtype=object, count=lengths.sum()))
+        self.token_ids = codes.astype(np.int32)
+        self.message_ids = np.repeat(np.arange(self.n_messages, dtype=np.int32), lengths)
+        self.vocab = pd.Index(vocab, dtype=object)
+
+        self.stop_mask = self.vocab.isin(stop_words)
+        self.token_lengths = self.vocab.str.len().to_numpy()
+
+    def take(self, positions):
+        """TokenIndex of the messages at sorted `positions`, sharing this index's vocabulary"""
+        items, message_ids = take_rows(self.message_ids, positions)
+        index = copy.copy(self)
+        index.n_messages = len(positions)
+        index.text_mask = self.text_mask[positions]
+        index.token_ids = self.token_ids[items]
+        index.message_ids = message_ids.astype(np.int32)
+        return index
+
+    def rows(self, df, selected_user='Overall', text_only=True):
+        """Boolean mask over messages for a user ('Overall' for everyone)"""
+        if selected_user == 'Overall':
+            mask = np.ones(self.n_messages, dtype=bool)
+        else:
+            mask = (df['user'] == selected_user).to_numpy()
+        if text_only:
+            mask &= self.text_mask
+        return mask
+
+    def counts(self, rows):
+        """Occurrences of every vocabulary token in the selected messages"""
+        selected = self.token_ids[rows[self.message_ids]]
+        return np.bincount(selected, minlength=len(self.vocab))
+
+    def word_frequencies(self, rows, min_length=1, top_n=None):
+        """
+        {word: count} over the selected messages, without stopwords or words shorter than
+        `min_length`; only the `top_n` most frequent words if given, most frequent first.
+        """
+        counts = self.counts(rows)
+        counts[self.stop_mask | (self.token_lengths < min_length)] = 0
+        ids = np.flatnonzero(counts)
+        if top_n is not None and ids.size > top_n:
+            # Partial selection instead of sorting the vocabulary; like a stable sort,
+            # words tied at the cut-off are taken in vocabulary order
+            kth = np.partition(counts[ids], ids.size - top_n)[ids.size - top_n]
+            above = ids[counts[ids] > kth]
+            ids = np.sort(np.concatenate([above, ids[counts[ids] == kth][:top_n - above.size]]))
+            ids = ids[np.argsort(-counts[ids], kind='stable')]
+        return dict(zip(self.vocab[ids], counts[ids].tolist()))
+
+    def most_common(self, rows, n, min_length=1):
+        """
+        Top `n` (word, count) pairs like Counter.most_common: ties keep the order
+        in which words first appear in the selected messages.
+        """
+        selected = self.token_ids[rows[self.message_ids]]
+        keep = ~(self.stop_mask[selected] | (self.token_lengths[selected] < min_length))
+        selected = selected[keep]
+        if selected.size == 0:
+            return []
+
+        ids, first_seen, counts = np.unique(selected, return_index=True, return_counts=True)
+        order = np.lexsort((first_seen, -counts))[:n]
+        return list(zip(self.vocab[ids[order]], counts[order].tolist()))
+
+    def message_sums(self, weights):
+        """Per-message sum of a weight assigned to every vocabulary token"""
+        return np.bincount(self.message_ids, weights=weights[self.token_ids], minlength=self.n_messages)
+
+
+@per_frame
+def token_index(df):
+    """TokenIndex for a preprocessed DataFrame, built once per frame"""
+    with perf.span('token index', len(df)):
+        return TokenIndex(df)